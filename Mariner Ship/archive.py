@@ -0,0 +1,307 @@
+"""
+Compressed, lossless long-term archive of trajectories
+
+An archive file holds one (n x m) float64 or float32 buffer, e.g. the
+drivers' [time, u, v, r, x, y, psi, U, ui] or the CSV layout of
+simulate_data.py, cut into blocks of `block` rows. Every block is encoded on
+its own, so any range of rows is read by decoding only the blocks it covers,
+and the blocks are encoded and decoded on a thread pool.
+
+Inside a block every column is encoded separately:
+
+    time    : delta encoding, t0 and the step dt, plus the XOR of the bits of
+              every sample with t0+i*dt (all zero for a uniform time vector)
+    others  : XOR of the bits of every sample with the previous one (Gorilla)
+
+and the XOR words w go into three streams: a bitmap of w != 0, one header
+byte per nonzero w with its leading and trailing zero bits (in nibbles)
+and the packed meaningful bits. The split streams decode with array
+operations instead of a bit-by-bit loop.
+
+    archive.write("run.mtz",traj.data,U0 = traj.U0)
+    with archive.Archive("run.mtz") as a:
+        traj = a.trajectory()              # everything
+        part = a.read(10000,12000)         # rows 10000..11999, 1 block decoded
+
+File layout: header, block index (offset, bytes, rows per block), blocks.
+
+"""
+
+import json
+import mmap
+import os
+import struct
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from recorders import COLUMNS
+from trajectory import Trajectory
+
+MAGIC = b'MTZ1'
+HEADER = struct.Struct('<4sBBHIQdI')            #magic, itemsize, time column, columns, block rows, rows, U0, names bytes
+INDEX = struct.Struct('<QII')                   #offset, bytes, rows
+COLUMN = struct.Struct('<BII')                  #mode, header bytes, payload bytes
+
+XOR, DELTA = 0, 1
+UINT = {4: np.uint32, 8: np.uint64}
+NIBBLES = np.arange(1,16,dtype=np.uint64)*np.uint64(4)
+
+
+def _pack(w,bits):
+    """
+    Streams of the XOR words w (uint64 holding `bits`-bit words): flags, headers, payload
+
+    The meaningful bits of a nonzero word, between its leading and trailing zero
+    nibbles, are placed at their bit offset of the payload as 9 bytes per word;
+    the bytes of different words do not overlap, so a weighted bincount assembles them.
+    """
+    nonzero = w != 0
+    w = w[nonzero]
+    lead = np.count_nonzero(w[:,None] < (np.uint64(1) << (np.uint64(bits)-NIBBLES[:bits//4-1])),axis=1)
+    trail = np.count_nonzero(w[:,None] & ((np.uint64(1) << NIBBLES)-np.uint64(1)) == 0,axis=1)
+    length = (bits-4*(lead+trail)).astype(np.uint64)
+    offset = np.cumsum(length)-length
+    top = (w >> (4*trail).astype(np.uint64)) << (np.uint64(64)-length)
+    shift = offset & np.uint64(7)
+    window = np.empty((len(w),9),dtype=np.uint8)
+    window[:,:8] = (top >> shift).astype('>u8').view(np.uint8).reshape(-1,8)
+    window[:,8] = (top << (np.uint64(8)-shift)) & np.uint64(255)
+    at = (offset >> np.uint64(3)).astype(np.int64)[:,None]+np.arange(9)
+    size = int((length.sum()+7)//8) if len(w) else 0
+    payload = np.bincount(at.ravel(),window.ravel(),size+9)[:size].astype(np.uint8)
+    return np.packbits(nonzero),(lead*16+trail).astype(np.uint8),payload
+
+
+def _unpack(flags,headers,payload,n,bits):
+    """ XOR words (uint64) of the streams of _pack """
+    nonzero = np.unpackbits(flags,count=n).astype(bool)
+    lead = (headers >> 4).astype(np.uint64)
+    trail = (headers & 15).astype(np.uint64)
+    length = np.uint64(bits)-np.uint64(4)*(lead+trail)
+    offset = np.cumsum(length)-length
+    padded = np.concatenate((payload,np.zeros(9,dtype=np.uint8)))
+    at = (offset >> np.uint64(3)).astype(np.int64)[:,None]+np.arange(9)
+    window = padded[at]
+    shift = offset & np.uint64(7)
+    top = (np.ascontiguousarray(window[:,:8]).view('>u8').ravel().astype(np.uint64) << shift) | \
+          (window[:,8].astype(np.uint64) >> (np.uint64(8)-shift))
+    w = np.zeros(n,dtype=np.uint64)
+    w[nonzero] = (top >> (np.uint64(64)-length)) << (np.uint64(4)*trail)
+    return w
+
+
+def _predicted(t0,dt,n,dtype):
+    return (t0+np.arange(n,dtype=dtype)*dt).astype(dtype)
+
+
+def encode_block(data,time = 0):
+    """
+    Bytes of one block
+
+    Parameters
+    ----------
+    data : (n, m) float64 or float32 rows
+    time : column encoded with the delta encoding (None for none)
+    """
+    n,m = data.shape
+    itemsize = data.dtype.itemsize
+    words = np.ascontiguousarray(data).view(UINT[itemsize]).astype(np.uint64)
+    parts = []
+    for c in range(m):
+        w = words[:,c]
+        if c == time and n > 1:
+            t = data[:,c]
+            t0,dt = t[0],t[1]-t[0]
+            p = _predicted(t0,dt,n,data.dtype).view(UINT[itemsize]).astype(np.uint64)
+            mode,prefix,w = DELTA,struct.pack('<dd',t0,dt),w^p
+        else:
+            mode,prefix = XOR,b''
+            prev = np.zeros_like(w)
+            prev[1:] = w[:-1]
+            w = w^prev
+        flags,headers,payload = _pack(w,8*itemsize)
+        parts += [COLUMN.pack(mode,len(headers),len(payload)),prefix,flags.tobytes(),headers.tobytes(),payload.tobytes()]
+    return b''.join(parts)
+
+
+def decode_block(buf,n,m,dtype = np.float64):
+    """ (n, m) rows of a block written by encode_block """
+    dtype = np.dtype(dtype)
+    itemsize = dtype.itemsize
+    out = np.empty((n,m),dtype=dtype)
+    flag_bytes = (n+7)//8
+    k = 0
+    for c in range(m):
+        mode,nh,npay = COLUMN.unpack_from(buf,k)
+        k += COLUMN.size
+        if mode == DELTA:
+            t0,dt = struct.unpack_from('<dd',buf,k)
+            k += 16
+        flags = np.frombuffer(buf,np.uint8,flag_bytes,k)
+        headers = np.frombuffer(buf,np.uint8,nh,k+flag_bytes)
+        payload = np.frombuffer(buf,np.uint8,npay,k+flag_bytes+nh)
+        k += flag_bytes+nh+npay
+        w = _unpack(flags,headers,payload,n,8*itemsize)
+        if mode == DELTA:
+            w = w^_predicted(t0,dt,n,dtype).view(UINT[itemsize]).astype(np.uint64)
+        else:
+            w = np.bitwise_xor.accumulate(w)
+        out[:,c] = w.astype(UINT[itemsize]).view(dtype)
+    return out
+
+
+def write(path,data,block = 4096,U0 = 7.7175,columns = None,time = 0,threads = None):
+    """
+    Writes an (n, m) float64/float32 buffer to an archive file
+
+    Parameters
+    ----------
+    block   : rows per independently decodable block
+    columns : column names stored with the data (default recorders.COLUMNS for 9 columns)
+    time    : delta-encoded time column (None for none)
+    threads : encoder threads, default os.cpu_count()
+
+    Returns
+    -------
+    size : bytes written
+    """
+    data = np.asarray(data)
+    if data.dtype not in (np.float64,np.float32):
+        data = data.astype(np.float64)
+    n,m = data.shape
+    if columns is None and m == len(COLUMNS):
+        columns = COLUMNS
+    names = json.dumps(list(columns or [])).encode()
+    starts = range(0,n,block)
+    with ThreadPoolExecutor(threads or os.cpu_count()) as pool:
+        blocks = list(pool.map(lambda a: encode_block(data[a:a+block],time),starts))
+    offset = HEADER.size+len(names)+INDEX.size*len(blocks)
+    index = []
+    for a,b in zip(starts,blocks):
+        index.append(INDEX.pack(offset,len(b),min(block,n-a)))
+        offset += len(b)
+    tmp = path+'.tmp'
+    with open(tmp,'wb') as f:
+        f.write(HEADER.pack(MAGIC,data.dtype.itemsize,255 if time is None else time,m,block,n,U0,len(names)))
+        f.write(names)
+        f.write(b''.join(index))
+        for b in blocks:
+            f.write(b)
+    os.replace(tmp,path)
+    return offset
+
+
+def save(traj,path,**kwargs):
+    """ Writes a Trajectory to an archive file """
+    return write(path,traj.data,U0 = traj.U0,**kwargs)
+
+
+class Archive:
+
+    def __init__(self,path,threads = None):
+        self.path = path
+        self.file = open(path,'rb')
+        magic,itemsize,time,m,block,n,U0,k = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError("%s is not a trajectory archive" % path)
+        self.dtype = np.dtype({4: np.float32,8: np.float64}[itemsize])
+        self.columns = json.loads(self.file.read(k))
+        self.shape = (n,m)
+        self.block = block
+        self.U0 = U0
+        count = -(-n//block)
+        raw = self.file.read(INDEX.size*count)
+        self.index = [INDEX.unpack_from(raw,i*INDEX.size) for i in range(count)]
+        self.threads = threads or os.cpu_count()
+        # blocks are sliced from a read-only mapping: no shared file position between the decoding
+        # threads, and portable (os.pread does not exist on Windows)
+        self.map = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def decode(self,k):
+        """ Rows of block k """
+        offset,size,rows = self.index[k]
+        buf = self.map[offset:offset+size]
+        return decode_block(buf,rows,self.shape[1],self.dtype)
+
+    def read(self,start = 0,stop = None):
+        """ Rows start..stop-1, decoding only the blocks they cover (in parallel) """
+        stop = len(self) if stop is None else min(stop,len(self))
+        if stop <= start:
+            return np.empty((0,self.shape[1]),dtype=self.dtype)
+        first,last = start//self.block,(stop-1)//self.block
+        with ThreadPoolExecutor(self.threads) as pool:
+            parts = list(pool.map(self.decode,range(first,last+1)))
+        data = np.concatenate(parts)
+        return data[start-first*self.block:stop-first*self.block]
+
+    def trajectory(self,start = 0,stop = None):
+        """ Trajectory of rows start..stop-1 """
+        return Trajectory(self.read(start,stop),self.U0)
+
+
+def load(path,start = 0,stop = None):
+    """ Trajectory of rows start..stop-1 of an archive file """
+    with Archive(path) as a:
+        return a.trajectory(start,stop)
+
+
+def _report(name,runs,raw,**kwargs):
+    """ Archives every (n x m) buffer of runs, checks the round trip and prints ratios and throughput """
+    size = nbytes = 0
+    t_write = t_read = t_random = 0.0
+    for data in runs:
+        t0 = timer.perf_counter()
+        size += write("report.mtz",data,**kwargs)
+        t_write += timer.perf_counter()-t0
+        with Archive("report.mtz") as a:
+            t0 = timer.perf_counter()
+            back = a.read()
+            t_read += timer.perf_counter()-t0
+            t0 = timer.perf_counter()
+            a.read(len(a)//2,len(a)//2+100)
+            t_random += timer.perf_counter()-t0
+        assert np.array_equal(back.view(np.uint8),np.ascontiguousarray(data).view(np.uint8))
+        nbytes += data.nbytes
+    os.remove("report.mtz")
+    print("%s\n  %.2f MB (CSV) / %.2f MB (binary) -> %.2f MB : ratio %.1fx vs CSV, %.2fx vs binary\n"
+          "  encode %.1f MB/s, decode %.1f MB/s, 100 rows at random %.2f ms" %
+          (name,raw/1e6,nbytes/1e6,size/1e6,raw/size,nbytes/size,nbytes/t_write/1e6,nbytes/t_read/1e6,
+           t_random/len(runs)*1e3))
+
+
+if __name__ == "__main__":
+    import zig_zag_metrics
+
+    csv = "2000_sec_20_15_10_5.csv"
+    data = np.loadtxt(csv,delimiter=",")
+    _report(csv,[data],os.path.getsize(csv),columns = ['t','u','v','r','psi','U','delta'])
+
+    # sweep of zig-zags, one archive of (n x 9) rows per run
+    R, h, T = 100, 0.1, 1000
+    rng = np.random.default_rng(0)
+    angle = rng.choice([10,15,20,25],R)
+    U0 = rng.uniform(5,9,R)
+    for dtype in (np.float64,np.float32):
+        t,psi,delta,X = zig_zag_metrics.simulate(angle,angle,T,10,h,U0,dtype,states = True)
+        runs = []
+        for i in range(R):
+            data = np.empty((len(t),9),dtype=dtype)
+            data[:,0],data[:,1:7] = t,X[i,:,:6]
+            data[:,7] = np.hypot(U0[i]+X[i,:,0],X[i,:,1])
+            data[:,8] = delta[i]*np.pi/180
+            runs.append(data)
+        csv_bytes = len(t)*R*9*25                                 #'%.18e' text of the bundled CSV, 25 bytes a value
+        _report("sweep of %d zig-zags x %d s, %s" % (R,T,np.dtype(dtype).name),runs,csv_bytes)
@@ -0,0 +1,228 @@
+"""
+PID heading autopilot tuning over batched closed-loop simulations
+
+closed_loop() simulates R ships at once, each with its own PID gains, on a
+heading step and returns per-ship step-response metrics accumulated in the
+loop (no trajectories are kept):
+
+    overshoot : largest heading excursion beyond the reference (deg)
+    settling  : last time the heading error is outside the settling band (sec)
+    rudder    : total travel of the commanded rudder (deg)
+    cost      : weighted sum of the three (WEIGHTS)
+
+    ui = Kp*e + Ki*integral(e) - Kd*r,     e = psi_ref - psi
+
+The derivative acts on the measured yaw rate (no derivative kick at the step),
+the rudder command saturates at rudder_max and the integrator is frozen while
+it is saturated (anti-windup). Ki = 0 gives a PD autopilot.
+
+grid_search() and cma_es() split the gain sets into batches evaluated by a
+process pool and report the total tuning time. Gains are in rad/rad (Kp),
+rad/(rad s) (Ki) and rad/(rad/s) = s (Kd).
+
+"""
+
+import itertools
+import multiprocessing
+import os
+import time as timer
+import numpy as np
+import models
+
+WEIGHTS = {'overshoot': 1.0, 'settling': 0.05, 'rudder': 0.02}
+
+SCENARIO = {'psi_ref': 20.0, 'T': 400.0, 'h': 0.2, 'rudder_max': 35.0, 'band': 1.0}
+
+
+def closed_loop(Kp,Ki,Kd,psi_ref = 20.0,T = 400.0,h = 0.2,rudder_max = 35.0,band = 1.0,
+                U0 = 7.7175,ship = 'mariner',coeffs = None,weights = WEIGHTS):
+    """
+    Batched heading step response of R PID autopilots
+
+    Parameters
+    ----------
+    Kp, Ki, Kd : (R,) gains (scalars are broadcast)
+    psi_ref    : heading step (deg), scalar or (R,)
+    T, h       : simulation time and sampling time (sec)
+    rudder_max : rudder command limit (deg)
+    band       : settling band around the reference (deg)
+
+    Returns
+    -------
+    metrics : dict of (R,) arrays, 'overshoot', 'settling', 'rudder' and 'cost'
+
+    """
+    Kp,Ki,Kd,ref = np.broadcast_arrays(*(np.asarray(a,dtype=float) for a in (Kp,Ki,Kd,psi_ref*np.pi/180)))
+    R = Kp.size
+    Kp,Ki,Kd,ref = (a.ravel() for a in (Kp,Ki,Kd,ref))
+    sign = np.where(ref < 0,-1.0,1.0)
+    u_max = rudder_max*np.pi/180
+    band = band*np.pi/180
+    N = round(T/h)
+
+    f = models.get(ship).function
+    x = np.zeros((7,R))
+    integral = np.zeros(R)
+    u_prev = np.zeros(R)
+    overshoot = np.zeros(R)
+    settling = np.zeros(R)
+    travel = np.zeros(R)
+    for i in range(N):
+        e = ref-x[5]
+        u = Kp*e+Ki*integral-Kd*x[2]
+        u_sat = np.clip(u,-u_max,u_max)
+        integral = np.where((u == u_sat) | (np.sign(e) != np.sign(u)),integral+h*e,integral)
+        travel += np.abs(u_sat-u_prev)
+        u_prev = u_sat
+
+        xdot,U = f(x,u_sat,U0,coeffs)
+        x = x+h*np.array(xdot)
+
+        overshoot = np.maximum(overshoot,sign*(x[5]-ref))
+        settling = np.where(np.abs(ref-x[5]) > band,(i+1)*h,settling)
+
+    metrics = {'overshoot': overshoot*180/np.pi, 'settling': settling, 'rudder': travel*180/np.pi}
+    metrics['cost'] = sum(weights[k]*metrics[k] for k in weights)
+    return metrics
+
+
+def _evaluate(task):
+    """ Pool worker: metrics of one batch of gain sets """
+    gains,scenario = task
+    return closed_loop(gains[:,0],gains[:,1],gains[:,2],**scenario)
+
+
+def evaluate(gains,scenario = SCENARIO,workers = None,batch = 1000,pool = None):
+    """
+    Metrics of an (M,3) array of [Kp,Ki,Kd] gain sets, split into batches over a process pool
+
+    Returns
+    -------
+    metrics : dict of (M,) arrays
+    """
+    gains = np.atleast_2d(np.asarray(gains,dtype=float))
+    workers = workers or os.cpu_count()
+    batch = max(1,min(batch,-(-len(gains)//workers)))
+    tasks = [(gains[i:i+batch],scenario) for i in range(0,len(gains),batch)]
+    if pool is not None:
+        parts = pool.map(_evaluate,tasks)
+    elif workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(min(workers,len(tasks))) as p:
+            parts = p.map(_evaluate,tasks)
+    else:
+        parts = [_evaluate(t) for t in tasks]
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def grid_search(Kp,Ki,Kd,scenario = SCENARIO,workers = None,batch = 1000):
+    """
+    Exhaustive search over the grid Kp x Ki x Kd
+
+    Returns
+    -------
+    best    : [Kp,Ki,Kd] of the lowest cost
+    gains   : (M,3) all gain sets
+    metrics : dict of (M,) arrays
+    seconds : tuning time (wall clock)
+
+    """
+    t0 = timer.perf_counter()
+    gains = np.array(list(itertools.product(np.ravel(Kp),np.ravel(Ki),np.ravel(Kd))))
+    metrics = evaluate(gains,scenario,workers,batch)
+    best = gains[np.nanargmin(metrics['cost'])]
+    return best,gains,metrics,timer.perf_counter()-t0
+
+
+def cma_es(x0,sigma0 = 0.5,generations = 40,popsize = 64,scenario = SCENARIO,workers = None,
+           seed = 0,tol = 1e-6):
+    """
+    (mu/mu_w, lambda)-CMA-ES on the logarithm of the gains, one batched
+    evaluation (split over the pool) per generation
+
+    Parameters
+    ----------
+    x0     : initial [Kp,Ki,Kd], all > 0 (Ki is searched in log space too)
+    sigma0 : initial step size in log space
+
+    Returns
+    -------
+    best    : [Kp,Ki,Kd] of the lowest cost seen
+    cost    : its cost
+    history : best cost of every generation
+    seconds : tuning time (wall clock)
+
+    """
+    t0 = timer.perf_counter()
+    rng = np.random.default_rng(seed)
+    n = len(x0)
+    mean = np.log(np.asarray(x0,dtype=float))
+    sigma = sigma0
+    mu = popsize//2
+    w = np.log(mu+0.5)-np.log(np.arange(1,mu+1))
+    w /= w.sum()
+    mueff = 1/np.sum(w**2)
+    cc = (4+mueff/n)/(n+4+2*mueff/n)
+    cs = (mueff+2)/(n+mueff+5)
+    c1 = 2/((n+1.3)**2+mueff)
+    cmu = min(1-c1,2*(mueff-2+1/mueff)/((n+2)**2+mueff))
+    damps = 1+2*max(0,np.sqrt((mueff-1)/(n+1))-1)+cs
+    chiN = np.sqrt(n)*(1-1/(4*n)+1/(21*n*n))
+    pc,ps = np.zeros(n),np.zeros(n)
+    C = np.eye(n)
+
+    best,best_cost,history = np.exp(mean),np.inf,[]
+    workers = workers or os.cpu_count()
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        for g in range(generations):
+            vals,B = np.linalg.eigh(C)
+            D = np.sqrt(np.maximum(vals,1e-20))
+            z = rng.standard_normal((popsize,n))
+            y = z*D@B.T
+            X = mean+sigma*y
+            cost = evaluate(np.exp(X),scenario,workers,pool = pool)['cost']
+            cost = np.where(np.isfinite(cost),cost,np.inf)
+            order = np.argsort(cost)
+            if cost[order[0]] < best_cost:
+                best,best_cost = np.exp(X[order[0]]),cost[order[0]]
+            history.append(cost[order[0]])
+
+            yw = w@y[order[:mu]]
+            mean = mean+sigma*yw
+            invsqrtC = B@np.diag(1/D)@B.T
+            ps = (1-cs)*ps+np.sqrt(cs*(2-cs)*mueff)*invsqrtC@yw
+            hsig = np.linalg.norm(ps)/np.sqrt(1-(1-cs)**(2*(g+1)))/chiN < 1.4+2/(n+1)
+            pc = (1-cc)*pc+hsig*np.sqrt(cc*(2-cc)*mueff)*yw
+            ysel = y[order[:mu]]
+            C = ((1-c1-cmu)*C+c1*(np.outer(pc,pc)+(1-hsig)*cc*(2-cc)*C)
+                 +cmu*(ysel.T*w)@ysel)
+            sigma *= np.exp((cs/damps)*(np.linalg.norm(ps)/chiN-1))
+            if sigma*np.sqrt(vals.max()) < tol:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return best,best_cost,history,timer.perf_counter()-t0
+
+
+if __name__ == "__main__":
+    workers = os.cpu_count()
+
+    Kp = np.linspace(0.5,12,24)
+    Ki = np.concatenate(([0.0],np.geomspace(1e-4,1e-2,4)))
+    Kd = np.linspace(5,100,16)
+    best,gains,metrics,seconds = grid_search(Kp,Ki,Kd,workers = workers)
+    i = np.nanargmin(metrics['cost'])
+    print("Grid search : %d gain sets on %d workers in %.1f s (%.0f closed-loop runs/s)" %
+          (len(gains),workers,seconds,len(gains)/seconds))
+    print("  Kp %.3f  Ki %.2e  Kd %.2f   overshoot %.2f deg  settling %.1f s  rudder %.1f deg  cost %.3f" %
+          (*best,metrics['overshoot'][i],metrics['settling'][i],metrics['rudder'][i],metrics['cost'][i]))
+
+    x0 = best+np.array([0,1e-4,0])                  #CMA-ES searches log-gains, Ki must be > 0
+    best,cost,history,seconds_cma = cma_es(x0,workers = workers)
+    m = closed_loop(*best)
+    print("CMA-ES      : %d generations in %.1f s" % (len(history),seconds_cma))
+    print("  Kp %.3f  Ki %.2e  Kd %.2f   overshoot %.2f deg  settling %.1f s  rudder %.1f deg  cost %.3f" %
+          (*best,m['overshoot'][0],m['settling'][0],m['rudder'][0],m['cost'][0]))
+    print("Total tuning time : %.1f s" % (seconds+seconds_cma))
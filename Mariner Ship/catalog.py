@@ -0,0 +1,250 @@
+"""
+Indexed run catalog of simulation results (SQLite)
+
+A Catalog is a directory holding catalog.sqlite and the trajectories as .npy
+files. Every run is recorded when it is written, with
+
+    runs    : kind, ship, model hash, U0, h, T, rudder, heading, t_rudderexecute,
+              precision, the other parameters as JSON, file path, rows, created
+    metrics : (run, name, value) summary metrics, e.g. the zig-zag overshoots
+
+and indexes on the parameter columns and on (metric name, value), so a query
+over thousands of runs does not touch the trajectory files:
+
+    cat = catalog.Catalog("sweep")
+    cat.save(traj,{'kind': 'zigzag','rudder': 20,'heading': 20,'U0': 7.7})
+    runs = cat.query(kind = 'zigzag',rudder = 20,heading = 20,U0 = ('>',7),
+                     metrics = {'overshoot_1': ('>',12)})
+    for run,traj in cat.trajectories(runs):       # memory-mapped Trajectory objects
+        ...
+
+Filters are a value (equality), (op, value) with op in < <= > >= = != or
+('between', low, high).
+
+"""
+
+import json
+import os
+import sqlite3
+import time as timer
+import numpy as np
+import zig_zag_metrics
+from models import model_hash
+from trajectory import Trajectory
+
+PARAMETERS = ['kind','ship','U0','h','T','rudder','heading','t_rudderexecute','precision']
+RUN_COLUMNS = ['id']+PARAMETERS[:2]+['model_hash']+PARAMETERS[2:]+['params','path','rows','created']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id              INTEGER PRIMARY KEY,
+    kind            TEXT,
+    ship            TEXT,
+    model_hash      TEXT,
+    U0              REAL,
+    h               REAL,
+    T               REAL,
+    rudder          REAL,
+    heading         REAL,
+    t_rudderexecute REAL,
+    precision       TEXT,
+    params          TEXT,
+    path            TEXT UNIQUE,
+    rows            INTEGER,
+    created         REAL
+);
+CREATE TABLE IF NOT EXISTS metrics (
+    run_id INTEGER REFERENCES runs(id) ON DELETE CASCADE,
+    name   TEXT,
+    value  REAL,
+    PRIMARY KEY (run_id, name)
+);
+CREATE INDEX IF NOT EXISTS runs_maneuver ON runs(kind, rudder, heading, U0);
+CREATE INDEX IF NOT EXISTS runs_U0 ON runs(U0);
+CREATE INDEX IF NOT EXISTS runs_model ON runs(model_hash);
+CREATE INDEX IF NOT EXISTS metrics_value ON metrics(name, value);
+"""
+
+OPERATORS = {'<','<=','>','>=','=','!='}
+
+
+def _scalar(value):
+    """ numpy scalars as Python scalars (sqlite3 and json only take the latter) """
+    return value.item() if isinstance(value,np.generic) else value
+
+
+def _condition(column,spec,args):
+    """ SQL condition of one filter, appends its arguments to args """
+    if isinstance(spec,tuple):
+        if spec[0] == 'between':
+            args.extend(spec[1:3])
+            return "%s BETWEEN ? AND ?" % column
+        if spec[0] not in OPERATORS:
+            raise ValueError("Unknown operator %r" % (spec[0],))
+        args.append(spec[1])
+        return "%s %s ?" % (column,spec[0])
+    args.append(spec)
+    return "%s = ?" % column
+
+
+def _order(order):
+    """ ORDER BY clause of 'column' or 'column DESC', the column checked against the runs table """
+    words = (order or "id").split()
+    if len(words) not in (1,2) or (len(words) == 2 and words[1].upper() not in ('ASC','DESC')):
+        raise ValueError("Invalid order %r, expected 'column' or 'column DESC'" % (order,))
+    if words[0] not in RUN_COLUMNS:
+        raise KeyError("Unknown run column %r" % words[0])
+    return " ORDER BY runs.%s" % " ".join([words[0]]+[w.upper() for w in words[1:]])
+
+
+class Catalog:
+
+    def __init__(self,directory):
+        self.directory = directory
+        os.makedirs(directory,exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory,'catalog.sqlite'))
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def add(self,path,params,metrics = None,rows = None,coeffs = None):
+        """
+        Records an existing .npy trajectory file
+
+        params  : run parameters, PARAMETERS are stored in indexed columns, the rest as JSON
+        metrics : {name: value} summary metrics
+        Returns the run id
+        """
+        params = dict(params)
+        columns = {k: _scalar(params.pop(k,None)) for k in PARAMETERS}
+        columns['ship'] = columns['ship'] or 'mariner'
+        if rows is None:
+            rows = len(np.load(path,mmap_mode='r'))
+        with self.db:
+            cur = self.db.execute(
+                "INSERT INTO runs (%s, model_hash, params, path, rows, created) VALUES (%s)"
+                % (", ".join(PARAMETERS),", ".join("?"*(len(PARAMETERS)+5))),
+                [columns[k] for k in PARAMETERS]+[model_hash(columns['ship'],coeffs),
+                                                  json.dumps({k: _scalar(v) for k,v in params.items()}),
+                                                  os.path.relpath(path,self.directory),rows,timer.time()])
+            run_id = cur.lastrowid
+            self.db.executemany("INSERT INTO metrics VALUES (?, ?, ?)",
+                                [(run_id,k,float(v)) for k,v in (metrics or {}).items()
+                                 if v is not None and np.isfinite(v)])
+        return run_id
+
+    def save(self,traj,params,metrics = None,name = None,coeffs = None):
+        """
+        Writes a Trajectory to the catalog directory and records it
+
+        For zig-zags (a 'heading' parameter) without metrics, the zig-zag metrics
+        of zig_zag_metrics.extract are computed and recorded. `name` must end in .npy,
+        FileExistsError is raised if it is taken.
+        Returns the run id
+        """
+        if metrics is None and params.get('heading') is not None:
+            m = zig_zag_metrics.extract(traj.psi_deg[None],traj.delta_deg[None],traj.t,params['heading'])
+            metrics = {k: v[0] for k,v in m.items()}
+        if name is None:
+            name = "run_%d_%s.npy" % (int(timer.time()*1e6),os.getpid())
+        if not name.endswith(".npy"):
+            raise ValueError("Catalog runs are .npy files, got name %r" % name)
+        path = os.path.join(self.directory,name)
+        # exclusive create: an existing run file is never overwritten
+        with open(path,'xb') as f:
+            np.save(f,traj.data)
+        return self.add(path,params,metrics,len(traj),coeffs)
+
+    def query(self,metrics = None,order = None,limit = None,**filters):
+        """
+        Runs matching the parameter filters (PARAMETERS and 'model_hash') and metric filters,
+        sorted by `order`, a run column optionally followed by DESC (default 'id')
+
+        Returns
+        -------
+        runs : list of dicts with the run columns, 'params' and 'metrics' decoded
+        """
+        where,args = [],[]
+        for column,spec in filters.items():
+            if column not in PARAMETERS+['model_hash','id']:
+                raise KeyError("Unknown run column %r" % column)
+            where.append(_condition("runs."+column,spec,args))
+        for name,spec in (metrics or {}).items():
+            args.append(name)
+            where.append("EXISTS (SELECT 1 FROM metrics m WHERE m.run_id = runs.id AND m.name = ? AND %s)"
+                         % _condition("m.value",spec,args))
+        sql = "SELECT * FROM runs"
+        if where:
+            sql += " WHERE "+" AND ".join(where)
+        sql += _order(order)
+        if limit:
+            sql += " LIMIT %d" % limit
+        runs = [dict(row) for row in self.db.execute(sql,args)]
+        if runs:
+            ids = [r['id'] for r in runs]
+            values = {}
+            for k in range(0,len(ids),500):
+                part = ids[k:k+500]
+                for row in self.db.execute("SELECT * FROM metrics WHERE run_id IN (%s)" % ",".join("?"*len(part)),part):
+                    values.setdefault(row['run_id'],{})[row['name']] = row['value']
+            for r in runs:
+                r['params'] = json.loads(r['params'])
+                r['metrics'] = values.get(r['id'],{})
+        return runs
+
+    def arrays(self,runs):
+        """ Memory-mapped (n x 9) buffers of the runs """
+        return [np.load(os.path.join(self.directory,r['path']),mmap_mode='r') for r in runs]
+
+    def trajectories(self,runs):
+        """ (run, memory-mapped Trajectory) pairs """
+        return [(r,Trajectory(a,r['U0'] if r['U0'] is not None else 7.7175)) for r,a in zip(runs,self.arrays(runs))]
+
+
+if __name__ == "__main__":
+    import shutil
+    from recorders import COLUMNS
+
+    directory = "mariner_catalog"
+    shutil.rmtree(directory,ignore_errors=True)
+    rng = np.random.default_rng(0)
+    R = 2000
+    angle = rng.choice([10,15,20,25],R)
+    U0 = rng.uniform(5,9,R)
+    h, T = 0.1, 400
+
+    # sweep, written run by run as the drivers' (n x 9) buffers
+    t,psi,delta,X = zig_zag_metrics.simulate(angle,angle,T,10,h,U0,np.float32,states = True)
+    t0 = timer.perf_counter()
+    with Catalog(directory) as cat:
+        for i in range(R):
+            data = np.empty((len(t),len(COLUMNS)),dtype=np.float32)
+            data[:,0],data[:,1:7] = t,X[i,:,:6]
+            data[:,7] = np.hypot(U0[i]+X[i,:,0],X[i,:,1])
+            data[:,8] = delta[i]*np.pi/180
+            cat.save(Trajectory(data,U0[i]),{'kind': 'zigzag','rudder': angle[i],'heading': angle[i],
+                                             'U0': U0[i],'h': h,'T': T,'t_rudderexecute': 10},
+                     name = "zigzag_%05d.npy" % i)
+        print("Catalogued %d runs in %.1f s" % (R,timer.perf_counter()-t0))
+
+        t0 = timer.perf_counter()
+        runs = cat.query(kind = 'zigzag',rudder = 20,heading = 20,U0 = ('>',7),
+                         metrics = {'overshoot_1': ('>',8)})
+        t_query = timer.perf_counter()-t0
+        t0 = timer.perf_counter()
+        trajs = cat.trajectories(runs)
+        t_open = timer.perf_counter()-t0
+        print("20/20 zig-zags, U0 > 7 m/s, overshoot > 8 deg : %d runs (query %.1f ms, memory-mapped in %.1f ms)" %
+              (len(runs),t_query*1e3,t_open*1e3))
+        for run,traj in trajs[:5]:
+            print("  %-20s U0 %.2f  overshoot %.2f deg  max |psi| %.2f deg" %
+                  (run['path'],run['U0'],run['metrics']['overshoot_1'],np.abs(traj.psi_deg).max()))
@@ -0,0 +1,279 @@
+"""
+Generated, specialized right-hand side of the Mariner model
+
+generate() turns a coefficient table into the source of a straight-line
+NumPy function with the signature of mariner.activate:
+
+    - the X, Y and N polynomials are expanded into monomials of the
+      non-dimensional (u, v, r, delta), and Y and N are combined through the
+      inverse mass matrix into the sway and yaw rows directly
+    - constants are folded: the mass matrix, 1/L, 1/(L^2) and the coefficient
+      products collapse into one number per monomial and row, terms of the
+      same monomial are merged and zero terms are dropped; polynomials in u
+      that are multiples of powers of 1+u (Yv = Yvu, Yd:Yud:Yuud = 1:2:1,
+      ...) are factored, so the sway and yaw rows have 9 terms instead of 15
+    - the powers and products of u, v, r, delta are computed once and shared
+      by the three rows, U^2 is used instead of (sqrt(...))^2, and the
+      kinematics reduce to (U0+u)cos(psi)-v sin(psi), ... and r
+
+specialize() caches the generated module on disk under the hash of the model
+(models.model_hash) and of the generator (generator_hash: this file, the
+force terms and the rudder limits), so every process of a sweep imports the
+same file instead of generating it again, and a changed generator never
+loads a stale one:
+
+    f = codegen.specialize('mariner')
+    xdot,U = f(x,ui)                 # same result as mariner.activate(x,ui)
+
+The specialized function has the coefficients built in: it raises when
+called with a coefficient table, and model(...).with_coefficients() generates
+the function of the new table. Coefficient tables with per-ship (array)
+entries are not supported.
+
+"""
+
+import hashlib
+import importlib.util
+import json
+import os
+import tempfile
+import time as timer
+from math import comb
+import numpy as np
+import mariner
+import models
+import sysid
+
+CACHE = os.environ.get('MARINER_CODEGEN_CACHE',os.path.join(os.path.expanduser('~'),'.cache','mariner_codegen'))
+
+VARIABLES = ('u','w','v','r','d')          #w = 1+u
+
+
+def generator_hash():
+    """ Short hash of the generator: the source of this file, the force terms and the rudder limits """
+    with open(__file__,'rb') as f:
+        text = f.read()
+    text += json.dumps([sysid.X_TERMS,sysid.Y_TERMS,sysid.N_TERMS,
+                        mariner.delta_max,mariner.Ddelta_max]).encode()
+    return hashlib.sha256(text).hexdigest()[:16]
+
+
+def _key(ship = 'mariner',coeffs = None):
+    """ Cache key of a generated module: model hash and generator hash """
+    return "rhs_%s_%s" % (models.model_hash(ship,coeffs),generator_hash())
+
+
+def _monomial(e):
+    """ Name of the monomial with exponents e of (u, w, v, r, d): (1,0,2,0,1) -> 'u_v2_d' """
+    parts = [s+(str(p) if p > 1 else '') for s,p in zip(VARIABLES,e) if p]
+    return '_'.join(parts) or '1'
+
+
+def rows(ship = 'mariner',coeffs = None,rtol = 1e-12):
+    """
+    Folded polynomial rows of the force part of xdot
+
+    The terms of every row are grouped by their powers of (v, r, delta); the
+    polynomial in u of a group is rewritten in w = 1+u when that needs fewer
+    terms, e.g. Yd*d + Yud*u*d + Yuud*u^2*d = Yd*w^2*d when Yud = 2*Yd and Yuud = Yd,
+    as for the Mariner table (Yvu = Yv, Nru = Nr, ...).
+
+    Returns
+    -------
+    {row: {exponents: coefficient}} for the rows 0 (surge), 1 (sway), 2 (yaw), so that
+    xdot[row] = U^2 * sum(coefficient * u^eu w^ew v^ev r^er d^ed)
+    """
+    model = models.get(ship)
+    c = dict(model.coefficients)
+    c.update(coeffs or {})
+    if any(np.ndim(v) for v in c.values()):
+        raise ValueError("codegen specializes scalar coefficient tables only")
+    L = model.L
+    m11 = c['m']-c['Xudot']
+    m22 = c['m']-c['Yvdot']
+    m23 = c['m']*c['xG']-c['Yrdot']
+    m32 = c['m']*c['xG']-c['Nvdot']
+    m33 = c['Iz']-c['Nrdot']
+    det = m22*m33-m23*m32
+
+    weights = {0: {'X': 1/(L*m11)},
+               1: {'Y': m33/(L*det), 'N': -m23/(L*det)},
+               2: {'Y': -m32/(L*L*det), 'N': m22/(L*L*det)}}
+    terms = {'X': sysid.X_TERMS, 'Y': sysid.Y_TERMS, 'N': sysid.N_TERMS}
+    out = {}
+    for row,w in weights.items():
+        groups = {}
+        for force,scale in w.items():
+            for name in terms[force]:
+                eu,ev,er,ed = sysid.exponents(name)
+                a = groups.setdefault((ev,er,ed),np.zeros(4))
+                a[eu] += float(c[name])*scale
+        poly = {}
+        for rest,a in groups.items():
+            tol = rtol*np.abs(a).max()
+            # the same polynomial in w = 1+u: b_j = sum_k a_k C(k,j) (-1)^(k-j)
+            b = np.array([sum(a[k]*comb(k,j)*(-1)**(k-j) for k in range(j,4)) for j in range(4)])
+            use_w = np.sum(np.abs(b) > tol) < np.sum(np.abs(a) > tol)
+            for j,value in enumerate(b if use_w else a):
+                if abs(value) > tol:
+                    poly[(0,j)+rest if use_w else (j,0)+rest] = value
+        out[row] = poly
+    return out
+
+
+def generate(ship = 'mariner',coeffs = None):
+    """ Source code of the specialized activate(x,ui,U0 = 7.7175,coeffs = None) """
+    model = models.get(ship)
+    poly = rows(ship,coeffs)
+    order = lambda e: (sum(e),e)
+    used = sorted({e for p in poly.values() for e in p},key=order)
+    L = float(model.L)
+    n = len(VARIABLES)
+
+    code = ["# Generated by codegen.py for model %r (%s), do not edit" % (model.name,_key(ship,coeffs)),
+            "import numpy as np",
+            "",
+            "def activate(x,ui,U0 = 7.7175,coeffs = None):",
+            "    if coeffs is not None:",
+            "        raise ValueError('the coefficients of a generated model are built in, '",
+            "                         'generate the function of the table with codegen.specialize(ship,coeffs)')",
+            "    u1 = U0+x[0]",
+            "    U2 = u1*u1+x[1]*x[1]",
+            "    U = np.sqrt(U2)",
+            "    iU = 1/U",
+            "    u = x[0]*iU",
+            "    w = 1+u",
+            "    v = x[1]*iU",
+            "    r = x[2]*(%r*iU)" % L,
+            "    d = x[6]"]
+
+    # shared powers of every variable, then shared prefix products of the monomials
+    for k,s in enumerate(VARIABLES):
+        top = max((e[k] for e in used),default=0)
+        for p in range(2,top+1):
+            code.append("    %s%d = %s*%s" % (s,p,s+(str(p-1) if p > 2 else ''),s))
+    unit = lambda k,p: tuple(p if j == k else 0 for j in range(n))
+    defined = {unit(k,p) for k in range(n) for p in range(4)}
+    for e in used:
+        prefix = unit(0,0)
+        for k in range(n):
+            if e[k] == 0:
+                continue
+            new = tuple(prefix[j]+(e[j] if j == k else 0) for j in range(n))
+            if new not in defined:
+                code.append("    %s = %s*%s" % (_monomial(new),_monomial(prefix),_monomial(unit(k,e[k]))))
+                defined.add(new)
+            prefix = new
+
+    for row in range(3):
+        expr = ""
+        for e in sorted(poly[row],key=order):
+            a = float(poly[row][e])
+            term = repr(abs(a)) if sum(e) == 0 else "%r*%s" % (abs(a),_monomial(e))
+            expr += ("-" if a < 0 else "")+term if not expr else (" - " if a < 0 else " + ")+term
+        code.append("    F%d = %s" % (row,expr or "0.0*u"))
+
+    dmax = mariner.delta_max*np.pi/180
+    ddmax = mariner.Ddelta_max*np.pi/180
+    code += ["    delta_dot = np.clip(np.clip(-ui,%r,%r)-d,%r,%r)" % (-dmax,dmax,-ddmax,ddmax),
+             "    c = np.cos(x[5])",
+             "    s = np.sin(x[5])",
+             "    xdot = [F0*U2,",
+             "            F1*U2,",
+             "            F2*U2,",
+             "            c*u1-s*x[1],",
+             "            s*u1+c*x[1],",
+             "            x[2],",
+             "            delta_dot]",
+             "    return xdot,U",
+             ""]
+    return "\n".join(code)
+
+
+def specialize(ship = 'mariner',coeffs = None,cache = None):
+    """
+    Specialized activate function of a model, generated once and cached on disk
+
+    Returns
+    -------
+    activate : function with the signature of mariner.activate (coeffs must be None)
+    """
+    cache = cache or CACHE
+    key = _key(ship,coeffs)
+    path = os.path.join(cache,key+".py")
+    if not os.path.exists(path):
+        os.makedirs(cache,exist_ok=True)
+        fd,tmp = tempfile.mkstemp(dir=cache,suffix='.tmp')
+        with os.fdopen(fd,'w') as f:
+            f.write(generate(ship,coeffs))
+        os.replace(tmp,path)
+    spec = importlib.util.spec_from_file_location(key,path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.activate
+
+
+class GeneratedModel(models.VesselModel):
+    """ VesselModel of a generated function, with_coefficients() generates the function of the new table """
+
+    def __init__(self,ship = 'mariner',coeffs = None,cache = None):
+        base = models.get(ship)
+        table = dict(base.coefficients)
+        table.update(coeffs or {})
+        super().__init__(base.name+'_generated',specialize(ship,coeffs,cache),table,base.state,base.U0,base.L)
+        self.ship = ship
+        self.overrides = dict(coeffs or {})
+        self.cache = cache
+
+    def with_coefficients(self,coeffs):
+        return GeneratedModel(self.ship,{**self.overrides,**coeffs},self.cache)
+
+
+def model(ship = 'mariner',coeffs = None,cache = None):
+    """ GeneratedModel using the generated function, usable as the `ship` argument of the drivers """
+    return GeneratedModel(ship,coeffs,cache)
+
+
+def check(f,ship = 'mariner',coeffs = None,K = 10000,seed = 0):
+    """ Largest relative deviation of f from the hand-written model over random states """
+    rng = np.random.default_rng(seed)
+    x = np.vstack((rng.normal(0,1,K),rng.normal(0,0.5,K),rng.normal(0,0.01,K),rng.normal(0,1000,(2,K)),
+                   rng.uniform(-np.pi,np.pi,K),rng.uniform(-0.6,0.6,K)))
+    ui = rng.uniform(-0.8,0.8,K)
+    a,Ua = models.get(ship).with_coefficients(coeffs or {}).function(x,ui,7.7175)
+    b,Ub = f(x,ui)
+    a,b = np.array(a),np.array(b)
+    scale = np.maximum(np.abs(a).max(axis=1,keepdims=True),1e-300)
+    return max((np.abs(a-b)/scale).max(),np.abs(Ua-Ub).max()/Ua.max())
+
+
+if __name__ == "__main__":
+    t0 = timer.perf_counter()
+    source = generate()
+    t_gen = timer.perf_counter()-t0
+    t0 = timer.perf_counter()
+    f = specialize()
+    t_load = timer.perf_counter()-t0
+    print("Generated %d lines in %.1f ms, loaded from the cache in %.1f ms" %
+          (source.count("\n"),t_gen*1e3,t_load*1e3))
+    print("Max relative deviation from mariner.activate : %.2e" % check(f))
+
+    # complex-step safety (used by sensitivity.py)
+    x = np.zeros((7,1),dtype=complex)
+    x[1] += 1j*1e-30
+    print("Complex step dv'/dv : generated %.6e, hand-written %.6e" %
+          (np.array(f(x,0.1)[0])[1,0].imag/1e-30,np.array(mariner.activate(x,0.1)[0])[1,0].imag/1e-30))
+
+    for K in (1,1000,100000):
+        x = np.zeros((7,K))
+        x[0],x[1],x[2] = 0.1,0.2,0.001
+        ui = np.full(K,0.1)
+        steps = max(10,100000//K)
+        times = {}
+        for name,g in 3*[('hand-written',mariner.activate),('generated',f)]:
+            t0 = timer.perf_counter()
+            for i in range(steps):
+                g(x,ui)
+            times[name] = min(times.get(name,np.inf),(timer.perf_counter()-t0)/steps)
+        print("K = %6d : hand-written %9.1f us   generated %9.1f us   speedup %.2fx" %
+              (K,times['hand-written']*1e6,times['generated']*1e6,times['hand-written']/times['generated']))
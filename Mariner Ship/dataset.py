@@ -0,0 +1,199 @@
+"""
+Sharded training-dataset generator for learned Mariner ship models
+
+Randomized rudder schedules and initial states are simulated with the batched
+mariner.activate across a process pool. Every shard is a fixed-size .npy file
+of records
+
+    [u v r x y psi delta | ui | target]
+
+where target is either xdot (time derivative of the state) or the next state,
+so shards can be opened with np.load(..., mmap_mode='r') without reading them.
+manifest.json holds the configuration and the completed shards. Shard i is
+always generated from seed+i, so an interrupted run is resumed by calling
+generate() again with the same configuration: completed shards are kept and
+the missing ones are (re)generated.
+
+"""
+
+import json
+import multiprocessing
+import os
+import time as timer
+import numpy as np
+import mariner
+
+STATE   = ['u','v','r','x','y','psi','delta']
+COLUMNS = STATE+['ui']+[s+'_dot' for s in STATE]
+
+
+def euler_integration(xdot,x,h):
+    """ x_next = x + h*xdot """
+    return x + h*xdot
+
+
+def random_schedule(rng,n_runs,N,h,hold = (5,60),rudder_max = 35):
+    """
+    Piecewise constant rudder commands with random hold times.
+
+    Parameters
+    ----------
+    rng        : np.random.Generator
+    n_runs     : number of ships
+    N          : number of samples
+    h          : sampling time (sec)
+    hold       : [min,max] time a command is held (sec)
+    rudder_max : max commanded rudder angle (deg)
+
+    Returns
+    -------
+    ui : (n_runs, N) commanded rudder angle (rad)
+
+    """
+    t = np.arange(N)*h
+    M = int(np.ceil(N*h/hold[0]))+1
+    switch = np.cumsum(rng.uniform(hold[0],hold[1],(n_runs,M)),axis=1)
+    level = rng.uniform(-rudder_max,rudder_max,(n_runs,M+1))*np.pi/180
+    ui = np.empty((n_runs,N))
+    for i in range(n_runs):
+        ui[i] = level[i,np.searchsorted(switch[i],t,side='right')]
+    return ui
+
+
+def random_state(rng,n_runs):
+    """ Random initial states x = [u v r x y psi delta], returns (7, n_runs) """
+    x = np.zeros((7,n_runs))
+    x[0] = rng.uniform(-2.0,0.5,n_runs)
+    x[1] = rng.uniform(-0.5,0.5,n_runs)
+    x[2] = rng.uniform(-0.01,0.01,n_runs)
+    x[5] = rng.uniform(-np.pi,np.pi,n_runs)
+    x[6] = rng.uniform(-0.3,0.3,n_runs)
+    return x
+
+
+def simulate_shard(seed,runs,T,h,target = 'xdot',U0 = 7.7175,dtype = 'float32'):
+    """
+    Simulates one shard: `runs` ships for T seconds in a single batch
+
+    Returns
+    -------
+    records : (runs*N, 15) array, run-major (the N samples of a run are contiguous)
+
+    """
+    rng = np.random.default_rng(seed)
+    N = round(T/h)
+    ui = random_schedule(rng,runs,N,h)
+    x = random_state(rng,runs)
+
+    records = np.empty((runs,N,len(COLUMNS)),dtype = dtype)
+    for k in range(N):
+        xdot,U = mariner.activate(x,ui[:,k],U0)
+        xdot = np.array(xdot)
+        x_next = euler_integration(xdot,x,h)
+        records[:,k,:7] = x.T
+        records[:,k,7] = ui[:,k]
+        records[:,k,8:] = (xdot if target == 'xdot' else x_next).T
+        x = x_next
+    return records.reshape(runs*N,len(COLUMNS))
+
+
+def _write_shard(task):
+    path,seed,config = task
+    t0 = timer.perf_counter()
+    records = simulate_shard(seed,config['runs_per_shard'],config['T'],config['h'],
+                             config['target'],config['U0'],config['dtype'])
+    tmp = path+'.tmp.npy'
+    np.save(tmp,records)
+    os.replace(tmp,path)
+    return os.path.basename(path),len(records),timer.perf_counter()-t0
+
+
+def _save_manifest(out_dir,manifest):
+    tmp = os.path.join(out_dir,'manifest.json.tmp')
+    with open(tmp,'w') as f:
+        json.dump(manifest,f,indent=1)
+    os.replace(tmp,os.path.join(out_dir,'manifest.json'))
+
+
+def generate(out_dir,n_shards,runs_per_shard = 64,T = 600,h = 0.1,target = 'xdot',
+             U0 = 7.7175,dtype = 'float32',seed = 0,workers = None):
+    """
+    Generates (or resumes) a sharded dataset
+
+    Parameters
+    ----------
+    out_dir        : output directory, holds shard_XXXXX.npy and manifest.json
+    n_shards       : number of shards
+    runs_per_shard : ships simulated per shard (one batch)
+    T              : simulation time of a run (sec)
+    h              : sampling time (sec)
+    target         : 'xdot' or 'next' (next state)
+    U0             : nominal speed (m/s)
+    dtype          : record dtype
+    seed           : base seed, shard i uses seed+i
+    workers        : process pool size, default os.cpu_count()
+
+    Returns
+    -------
+    manifest : dict, also written to out_dir/manifest.json
+
+    """
+    if target not in ('xdot','next'):
+        raise ValueError("target must be 'xdot' or 'next'")
+
+    config = {'runs_per_shard': runs_per_shard, 'T': T, 'h': h, 'target': target,
+              'U0': U0, 'dtype': np.dtype(dtype).name, 'seed': seed}
+    os.makedirs(out_dir,exist_ok=True)
+
+    path = os.path.join(out_dir,'manifest.json')
+    manifest = {'columns': COLUMNS, 'config': config, 'shards': {}}
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+        if previous['config'] != config:
+            raise ValueError("%s was generated with a different configuration" % out_dir)
+        manifest['shards'] = previous['shards']
+
+    tasks = []
+    for i in range(n_shards):
+        name = 'shard_%05d.npy' % i
+        if name not in manifest['shards'] or not os.path.exists(os.path.join(out_dir,name)):
+            tasks.append((os.path.join(out_dir,name),seed+i,config))
+
+    workers = min(workers or os.cpu_count(),max(len(tasks),1))
+    samples = 0
+    t0 = timer.perf_counter()
+    if tasks:
+        print("Generating %d of %d shards on %d workers....." % (len(tasks),n_shards,workers))
+        with multiprocessing.Pool(workers) as pool:
+            for name,n,seconds in pool.imap_unordered(_write_shard,tasks):
+                manifest['shards'][name] = {'records': n, 'seconds': seconds}
+                _save_manifest(out_dir,manifest)
+                samples += n
+                print("  %s  %d records  %.1f s" % (name,n,seconds))
+    wall = timer.perf_counter()-t0
+
+    if samples:
+        manifest['throughput'] = {'samples': samples, 'wall': wall, 'workers': workers,
+                                  'samples_per_second_per_core': samples/wall/workers}
+        _save_manifest(out_dir,manifest)
+        print("Throughput : %.0f samples/s/core" % manifest['throughput']['samples_per_second_per_core'])
+    return manifest
+
+
+def load(out_dir):
+    """ Memory-maps every completed shard of a dataset, returns (manifest, [arrays]) """
+    with open(os.path.join(out_dir,'manifest.json')) as f:
+        manifest = json.load(f)
+    shards = [np.load(os.path.join(out_dir,name),mmap_mode='r') for name in sorted(manifest['shards'])]
+    return manifest,shards
+
+
+if __name__ == "__main__":
+    out_dir = "mariner_dataset"    #output directory
+    n_shards = 16                  #number of shards
+    runs_per_shard = 64            #ships per shard
+    T = 600                        #simulation time of a run (sec)
+    h = 0.1                        #sampling time (sec)
+
+    generate(out_dir,n_shards,runs_per_shard,T,h)
@@ -0,0 +1,211 @@
+"""
+Precomputed environmental disturbances: waves, wind gusts and current
+
+precompute() draws, for a batch of R runs, the wave-induced accelerations and
+the gust wind speed of every sample by inverse FFT of a JONSWAP wave spectrum
+and a Harris gust spectrum, with random phases from a seed. The result is a
+Disturbance holding (R, N) buffers, so the simulation loop only indexes them:
+
+    dist = disturbances.precompute(N,h,R,seed = 1,Hs = 3.0,Tp = 9.0,wave_dir = 30,
+                                   wind_speed = 12,wind_dir = 60,current_speed = 0.5,current_dir = 90)
+    ...
+    xdot,U = mariner.activate(x,u_ship)
+    xdot = dist.apply(i,x,xdot)
+
+Waves      : first-order Froude-Krylov forces of a box barge (L x B x T) per
+             wave component, for the wave direction relative to the initial
+             heading (approximate when the heading changes a lot, e.g. turning).
+Wind       : apparent wind from the gust speed, the wind direction and the ship
+             velocity, with the usual cos/sin/sin(2 gamma) wind coefficients.
+Current    : constant per run; u and v are velocities relative to the water, so
+             the current is added to the position kinematics only.
+
+Directions are in deg, "coming from" is not used: waves, wind and current all
+travel towards the given direction (earth frame, same angle as psi).
+
+"""
+
+import numpy as np
+import mariner
+
+rho_w = 1025.0         #water density (kg/m^3)
+rho_a = 1.225          #air density (kg/m^3)
+g = 9.81
+
+# Mariner main dimensions and windage
+B = 23.17              #beam (m)
+T = 8.23               #draft (m)
+A_F = 450.0            #frontal projected wind area (m^2)
+A_L = 2000.0           #lateral projected wind area (m^2)
+C_WIND = (0.7,0.8,0.1) #wind coefficients of X, Y, N
+
+
+def _masses(coeffs = None):
+    """ Dimensional surge/sway mass and yaw inertia including added mass """
+    c = mariner.coefficients if coeffs is None else coeffs
+    s = 0.5*rho_w*mariner.L**3
+    return (c['m']-c['Xudot'])*s,(c['m']-c['Yvdot'])*s,(c['Iz']-c['Nrdot'])*s*mariner.L**2
+
+
+def jonswap(omega,Hs,Tp,gamma = 3.3):
+    """ JONSWAP wave spectrum S(omega) (m^2 s), gamma = 1 is Pierson-Moskowitz """
+    wp = 2*np.pi/Tp
+    w = np.where(omega > 0,omega,np.inf)
+    sigma = np.where(w <= wp,0.07,0.09)
+    S = 5/16*Hs**2*wp**4/w**5*np.exp(-1.25*(wp/w)**4)
+    S = S*gamma**np.exp(-(w-wp)**2/(2*sigma**2*wp**2))*(1-0.287*np.log(gamma))
+    return np.where(omega > 0,S,0.0)
+
+
+def harris(f,V10,kappa = 0.0026,Lh = 1800.0):
+    """ Harris gust spectrum S(f) (m^2/s^2/Hz) of the longitudinal wind speed """
+    x = f*Lh/np.maximum(V10,1e-6)
+    return 4*kappa*V10*Lh/(2+x**2)**(5/6)
+
+
+def _series(amplitude,rng,M,R):
+    """ sum_k amplitude_k cos(w_k t + phase_k) on M samples by inverse FFT, (R, M) """
+    phase = rng.uniform(0,2*np.pi,(R,amplitude.shape[-1]))
+    return np.fft.irfft(amplitude*np.exp(1j*phase)*(M/2),n=M,axis=-1)
+
+
+class Disturbance:
+    """ Precomputed disturbance buffers of R runs, see precompute() """
+
+    def __init__(self,tau,wind,wind_dir,current,U0):
+        self.tau = tau              #(3, R, N) wave accelerations in surge, sway, yaw
+        self.wind = wind            #(R, N) wind speed, or None
+        self.wind_dir = wind_dir    #(R,) rad
+        self.current = current      #(2, R) current velocity (north, east), or None
+        self.U0 = U0
+        self.inertia = np.array(_masses())
+
+    def astype(self,dtype):
+        """ Copy with the buffers cast to dtype (e.g. the state type of the float32 drivers) """
+        cast = lambda a: None if a is None else np.asarray(a,dtype=dtype)
+        return Disturbance(cast(self.tau),cast(self.wind),cast(self.wind_dir),cast(self.current),self.U0)
+
+    def apply(self,i,x,xdot):
+        """ xdot of sample i with the disturbances added (x : (7,R) or (7,1) for R = 1) """
+        xdot = list(xdot)
+        tau = self.tau[:,:,i]
+        xdot[0] = xdot[0]+tau[0]
+        xdot[1] = xdot[1]+tau[1]
+        xdot[2] = xdot[2]+tau[2]
+        if self.wind is not None:
+            V = self.wind[:,i]
+            a = self.wind_dir-x[5]
+            u_rw = self.U0+x[0]-V*np.cos(a)
+            v_rw = x[1]-V*np.sin(a)
+            gamma = -np.arctan2(v_rw,u_rw)
+            q = 0.5*rho_a*(u_rw**2+v_rw**2)
+            cx,cy,cn = C_WIND
+            xdot[0] = xdot[0]-q*A_F*cx*np.cos(gamma)/self.inertia[0]
+            xdot[1] = xdot[1]+q*A_L*cy*np.sin(gamma)/self.inertia[1]
+            xdot[2] = xdot[2]+q*A_L*mariner.L*cn*np.sin(2*gamma)/self.inertia[2]
+        if self.current is not None:
+            xdot[3] = xdot[3]+self.current[0]
+            xdot[4] = xdot[4]+self.current[1]
+        return xdot
+
+
+def precompute(N,h,R = 1,seed = None,Hs = 0.0,Tp = 9.0,wave_dir = 0.0,gamma = 3.3,
+               wind_speed = 0.0,wind_dir = 0.0,current_speed = 0.0,current_dir = 0.0,
+               psi0 = 0.0,U0 = 7.7175):
+    """
+    Disturbance buffers of R runs of N samples
+
+    Parameters
+    ----------
+    N, h          : number of samples and sampling time (sec)
+    R             : number of runs (Monte Carlo batch)
+    seed          : seed of the random phases, the same seed gives the same forcing
+    Hs, Tp, gamma : significant wave height (m), peak period (sec), JONSWAP peak factor
+    wave_dir      : wave direction (deg)
+    wind_speed    : mean wind speed (m/s)
+    wind_dir      : wind direction (deg)
+    current_speed : current speed (m/s)
+    current_dir   : current direction (deg)
+    psi0          : initial heading (deg), the wave forces are referenced to it
+
+    Every sea state / wind / current parameter can be a scalar or an (R,) array.
+
+    Returns
+    -------
+    Disturbance
+
+    """
+    rng = np.random.default_rng(seed)
+    M = 1 << int(np.ceil(np.log2(max(N,2))))            #FFT length, >= N
+    omega = 2*np.pi*np.fft.rfftfreq(M,h)
+    dw = omega[1]-omega[0]
+    col = lambda p: np.broadcast_to(np.asarray(p,dtype=float),(R,))[:,None]
+
+    # waves: elevation spectrum times box barge Froude-Krylov transfer functions
+    tau = np.zeros((3,R,N))
+    Hs = col(Hs)
+    if np.any(Hs > 0):
+        a = np.sqrt(2*jonswap(omega,Hs,col(Tp),col(gamma))*dw)
+        k = omega**2/g
+        beta = np.radians(col(wave_dir)-col(psi0))
+        xl = k*mariner.L*np.cos(beta)/2
+        xb = k*B*np.sin(beta)/2
+        depth = np.exp(-k*T/2)
+        sinc = np.sinc(xl/np.pi)
+        lever = np.where(np.abs(xl) > 1e-6,(np.sin(xl)-xl*np.cos(xl))/np.where(xl == 0,1,xl)**2,0.0)
+        rao = [2*rho_w*g*B*T*depth*np.sin(xl),
+               2*rho_w*g*mariner.L*T*depth*np.sin(xb)*sinc,
+               rho_w*g*mariner.L**2*T*depth*np.sin(xb)*lever]
+        inertia = _masses()
+        # one set of phases for the three components of a run (same wave train)
+        state = rng.bit_generator.state
+        for j in range(3):
+            rng.bit_generator.state = state
+            tau[j] = _series(a*rao[j],rng,M,R)[:,:N]/inertia[j]
+
+    wind = None
+    if np.any(col(wind_speed) > 0):
+        V10 = col(wind_speed)
+        f = omega/(2*np.pi)
+        wind = V10+_series(np.sqrt(2*harris(f,V10)*(f[1]-f[0])),rng,M,R)[:,:N]
+
+    current = None
+    if np.any(col(current_speed) > 0):
+        beta_c = np.radians(col(current_dir)[:,0])
+        current = col(current_speed)[:,0]*np.array([np.cos(beta_c),np.sin(beta_c)])
+
+    return Disturbance(tau,wind,np.radians(col(wind_dir)[:,0]),current,U0)
+
+
+if __name__ == "__main__":
+    import time as timer
+    import zig_zag_metrics
+
+    R, h, Tsim = 500, 0.1, 600
+    N = round(Tsim/h)
+    rng = np.random.default_rng(0)
+    Hs = rng.uniform(1,5,R)
+    sea = dict(Hs = Hs,Tp = 4.5*np.sqrt(Hs)+3,wave_dir = rng.uniform(0,360,R),
+               wind_speed = 4*Hs+4,wind_dir = rng.uniform(0,360,R),
+               current_speed = rng.uniform(0,1,R),current_dir = rng.uniform(0,360,R))
+    t0 = timer.perf_counter()
+    dist = precompute(N,h,R,seed = 1,**sea)
+    print("Precomputed %d runs x %d samples in %.2f s" % (R,N,timer.perf_counter()-t0))
+    again = precompute(N,h,R,seed = 1,**sea)
+    print("Same seed, same forcing : %s" % (np.array_equal(again.tau,dist.tau) and np.array_equal(again.wind,dist.wind)))
+
+    rudder = np.full(R,20)
+    t0 = timer.perf_counter()
+    t,psi,delta = zig_zag_metrics.simulate(rudder,rudder,Tsim,10,h,dtype = np.float64)
+    t_calm = timer.perf_counter()-t0
+    t0 = timer.perf_counter()
+    t,psi_d,delta_d = zig_zag_metrics.simulate(rudder,rudder,Tsim,10,h,dtype = np.float64,disturbance = dist)
+    t_dist = timer.perf_counter()-t0
+    print("20/20 zig-zag, %d runs : calm %.2f s, with disturbances %.2f s" % (R,t_calm,t_dist))
+
+    calm = zig_zag_metrics.extract(psi[:1],delta[:1],t,20)
+    metrics = zig_zag_metrics.extract(psi_d,delta_d,t,20)
+    for k in ('overshoot_1','overshoot_2','period'):
+        v = metrics[k]
+        print("  %-12s calm %7.2f   Monte Carlo mean %7.2f  std %6.2f  5-95%% [%7.2f, %7.2f]" %
+              (k,calm[k][0],np.nanmean(v),np.nanstd(v),np.nanpercentile(v,5),np.nanpercentile(v,95)))
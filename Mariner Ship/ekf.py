@@ -0,0 +1,172 @@
+"""
+Vectorized extended Kalman filter for batches of Mariner ships
+
+The N filters run in lockstep as batched array operations: x is (n,N) as for
+the model, P is (N,n,n). The prediction uses the Euler step of the drivers
+
+    x[k+1] = x[k] + h*f(x[k],ui[k]),       F = I + h*df/dx
+
+with the exact Jacobian df/dx of sensitivity.jacobian (complex step, one model
+call for all ships). GPS position (x, y) and heading psi are measured, so the
+measurement matrix only selects states and the update needs a 3x3 solve per
+ship; the heading innovation is wrapped to [-pi, pi).
+
+measurements() generates noisy GPS/heading data from batched zig-zags of
+zig_zag_metrics.simulate for testing.
+
+"""
+
+import time as timer
+import numpy as np
+import sensitivity
+import zig_zag_metrics
+from rollout import wrap
+
+MEASURED = [3,4,5]                  #x, y, psi
+
+# default noise: GPS position (m), heading (rad), process noise on u, v, r, x, y, psi, delta
+SIGMA_GPS = 3.0
+SIGMA_PSI = 0.5*np.pi/180
+Q_DIAG = np.array([1e-4,1e-4,1e-8,1e-2,1e-2,1e-8,1e-8])
+
+
+def predict(x,P,ui,h,Q = Q_DIAG,U0 = 7.7175,ship = 'mariner',coeffs = None):
+    """
+    Time update of N filters
+
+    x : (n,N) state estimates, P : (N,n,n) covariances, ui : scalar or (N,) rudder command (rad)
+    Q : (n,) diagonal or (n,n) process noise covariance per step
+    """
+    f,J = sensitivity.jacobian(x,ui,U0,ship,coeffs)
+    n = x.shape[0]
+    F = np.eye(n)+h*J
+    P = F@P@F.transpose(0,2,1)
+    P = P+(np.diag(Q) if np.ndim(Q) == 1 else Q)
+    return x+h*f,P
+
+
+def update(x,P,z,R = None,measured = MEASURED):
+    """
+    Measurement update of N filters
+
+    z : (m,N) measurements of the states `measured` (NaN where there is none)
+    R : (m,) diagonal or (m,m) measurement noise covariance
+
+    Returns
+    -------
+    x, P : updated estimates
+    nis  : (N,) normalized innovation squared (consistency check, chi^2 with m dof)
+
+    """
+    if R is None:
+        R = np.array([SIGMA_GPS**2,SIGMA_GPS**2,SIGMA_PSI**2])
+    R = np.diag(R) if np.ndim(R) == 1 else R
+    innovation = z-x[measured]
+    if 5 in measured:
+        j = measured.index(5)
+        innovation[j] = wrap(innovation[j])
+    valid = np.all(np.isfinite(innovation),axis=0)
+    innovation = np.where(valid,innovation,0.0)
+
+    PHt = P[:,:,measured]                                   #(N,n,m)
+    S = PHt[:,measured,:]+R                                 #(N,m,m)
+    Sinv = np.linalg.inv(S)
+    K = PHt@Sinv
+    K = K*valid[:,None,None]
+    x = x+(K@innovation.T[:,:,None])[:,:,0].T
+    P = P-K@PHt.transpose(0,2,1)
+    P = 0.5*(P+P.transpose(0,2,1))
+    nis = np.einsum('mk,kmj,jk->k',innovation,Sinv,innovation)
+    return x,P,np.where(valid,nis,np.nan)
+
+
+def measurements(rudder,heading,Req_simulation_time,t_rudderexecute,h,every = 10,
+                 sigma_gps = SIGMA_GPS,sigma_psi = SIGMA_PSI,seed = None,U0 = 7.7175):
+    """
+    Synthetic GPS/heading measurements of batched zig-zags
+
+    Parameters
+    ----------
+    rudder, heading : (N,) zig-zag of every ship (deg), see zig_zag_metrics.simulate
+    every           : samples between two measurements (GPS at h*every sec)
+
+    Returns
+    -------
+    ui    : (T, N) commanded rudder (rad)
+    truth : (T, n, N) true states
+    z     : (T, 3, N) measured x, y, psi, NaN between measurements
+
+    """
+    rng = np.random.default_rng(seed)
+    t,psi,delta,X = zig_zag_metrics.simulate(rudder,heading,Req_simulation_time,t_rudderexecute,h,U0,
+                                             np.float64,states = True)
+    truth = X.transpose(1,2,0)
+    T,n,N = truth.shape
+    z = np.full((T,3,N),np.nan)
+    k = np.arange(every-1,T,every)
+    noise = np.array([sigma_gps,sigma_gps,sigma_psi])[None,:,None]
+    z[k] = truth[k][:,MEASURED]+noise*rng.standard_normal((len(k),3,N))
+    z[k,2] = wrap(z[k,2])
+    return delta.T*np.pi/180,truth,z
+
+
+def run(ui,z,h,x0 = None,P0 = None,Q = Q_DIAG,R = None,U0 = 7.7175):
+    """
+    Filters a batch of measurement series
+
+    ui : (T, N) rudder commands, z : (T, 3, N) measurements (NaN rows are skipped)
+
+    Returns
+    -------
+    X   : (T, n, N) estimates after every step
+    nis : (T, N) normalized innovation squared (NaN without measurement)
+
+    """
+    T,m,N = z.shape
+    n = 7
+    x = np.zeros((n,N)) if x0 is None else np.array(x0,dtype=float)
+    P = np.broadcast_to(np.diag([1.0,0.5,1e-4,100,100,1e-3,1e-4]) if P0 is None else P0,(N,n,n)).copy()
+    X = np.empty((T,n,N))
+    nis = np.full((T,N),np.nan)
+    for k in range(T):
+        x,P = predict(x,P,ui[k],h,Q,U0)
+        if np.isfinite(z[k]).any():
+            x,P,nis[k] = update(x,P,z[k],R)
+        X[k] = x
+    return X,nis
+
+
+if __name__ == "__main__":
+    h = 0.1
+    rng = np.random.default_rng(0)
+
+    # accuracy on a small batch
+    N = 200
+    angle = rng.choice([10,15,20],N)
+    ui,truth,z = measurements(angle,angle,600,10,h,seed = 1)
+    X,nis = run(ui,z,h)
+    k = slice(len(X)//2,None)
+    rms = np.sqrt(np.mean((X[k]-truth[k])**2,axis=(0,2)))
+    print("RMS error over the second half (N = %d) :" % N)
+    print("  u %.3f m/s   v %.3f m/s   r %.4f deg/s   position %.2f m   psi %.3f deg" %
+          (rms[0],rms[1],rms[2]*180/np.pi,np.hypot(rms[3],rms[4]),rms[5]*180/np.pi))
+    print("  mean NIS %.2f (3 expected)" % np.nanmean(nis[k]))
+
+    # throughput at N = 10,000
+    N = 10000
+    angle = rng.choice([10,15,20],N)
+    ui,truth,z = measurements(angle,angle,20,10,h,every = 1,seed = 2)
+    x = np.zeros((7,N))
+    P = np.broadcast_to(np.diag([1.0,0.5,1e-4,100,100,1e-3,1e-4]),(N,7,7)).copy()
+    steps = len(z)
+    t_predict = t_update = 0.0
+    for k in range(steps):
+        t0 = timer.perf_counter()
+        x,P = predict(x,P,ui[k],h)
+        t1 = timer.perf_counter()
+        x,P,_ = update(x,P,z[k])
+        t_update += timer.perf_counter()-t1
+        t_predict += t1-t0
+    total = t_predict+t_update
+    print("N = %d : %.1f ms per predict+update cycle (predict %.1f ms, update %.1f ms), %.2e filter updates/s" %
+          (N,total/steps*1e3,t_predict/steps*1e3,t_update/steps*1e3,N*steps/total))
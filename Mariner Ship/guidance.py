@@ -0,0 +1,141 @@
+"""
+Batched line-of-sight waypoint guidance
+
+follow() drives R ships along R waypoint routes at once: a lookahead-based
+LOS guidance law gives the desired heading of every ship
+
+    psi_d = alpha_k + atan(-e/Delta)
+
+(alpha_k : course of the active leg k, e : cross-track error, Delta : lookahead
+distance) and a PD heading autopilot (see autopilot.py) turns it into the rudder
+command. The active leg of every route is advanced with array operations when
+the ship comes within the acceptance radius of the next waypoint or passes it
+along the leg. Routes have different numbers of waypoints; shorter routes are
+padded by repeating their last waypoint.
+
+Only per-route cross-track statistics (mean, RMS, max of |e|) and the arrival
+time are accumulated in the loop, no trajectories are kept.
+
+"""
+
+import time as timer
+import numpy as np
+import models
+from rollout import wrap
+
+
+def random_routes(rng,R,legs = (3,6),leg_length = (1000,4000),turn = 60):
+    """
+    R random routes (e.g. harbor approaches), legs of leg_length (m) with turns up to `turn` deg
+
+    Returns
+    -------
+    waypoints : (R, W, 2) x, y of the waypoints, padded with the last one
+    count     : (R,) number of waypoints of every route
+    """
+    count = rng.integers(legs[0],legs[1]+1,R)+1
+    W = count.max()
+    course = rng.uniform(-np.pi,np.pi,(R,1))+np.cumsum(rng.uniform(-1,1,(R,W-1))*turn*np.pi/180,axis=1)
+    length = rng.uniform(*leg_length,(R,W-1))*(np.arange(1,W) < count[:,None])
+    steps = np.stack((length*np.cos(course),length*np.sin(course)),axis=2)
+    waypoints = np.concatenate((np.zeros((R,1,2)),np.cumsum(steps,axis=1)),axis=1)
+    return waypoints,count
+
+
+def _leg(waypoints,rows,leg,x):
+    """ Next waypoint, course, length, cross-track and along-track position of the active legs """
+    p0 = waypoints[rows,leg]
+    p1 = waypoints[rows,np.minimum(leg+1,waypoints.shape[1]-1)]
+    dx,dy = p1[:,0]-p0[:,0],p1[:,1]-p0[:,1]
+    alpha = np.arctan2(dy,dx)
+    ex,ey = x[3]-p0[:,0],x[4]-p0[:,1]
+    e = -ex*np.sin(alpha)+ey*np.cos(alpha)
+    s = ex*np.cos(alpha)+ey*np.sin(alpha)
+    return p1,alpha,np.hypot(dx,dy),e,s
+
+
+def follow(waypoints,count,T = 3600.0,h = 0.5,lookahead = 2*160.93,acceptance = 2*160.93,
+           Kp = 3.0,Kd = 60.0,rudder_max = 35.0,U0 = 7.7175,ship = 'mariner',coeffs = None):
+    """
+    Parameters
+    ----------
+    waypoints  : (R, W, 2) routes, see random_routes
+    count      : (R,) number of waypoints of every route
+    T, h       : maximum simulation time and sampling time (sec)
+    lookahead  : LOS lookahead distance Delta (m)
+    acceptance : waypoint acceptance radius (m)
+    Kp, Kd     : PD autopilot gains
+
+    Returns
+    -------
+    stats   : dict of (R,) arrays, 'mean', 'rms' and 'max' absolute cross-track error (m),
+              'arrival' time (sec, NaN if the route was not completed) and 'legs' completed
+    seconds : simulated ship time (sum over routes, sec)
+
+    """
+    waypoints = np.asarray(waypoints,dtype=float)
+    R = len(waypoints)
+    rows = np.arange(R)
+    last = np.asarray(count)-1
+    u_max = rudder_max*np.pi/180
+    f = models.get(ship).function
+
+    leg = np.zeros(R,dtype=int)
+    d = waypoints[:,1]-waypoints[:,0]
+    x = np.zeros((7,R))
+    x[3],x[4] = waypoints[:,0,0],waypoints[:,0,1]
+    x[5] = np.arctan2(d[:,1],d[:,0])
+
+    active = leg < last
+    n = np.zeros(R)
+    sum_e = np.zeros(R)
+    sum_e2 = np.zeros(R)
+    max_e = np.zeros(R)
+    arrival = np.full(R,np.nan)
+    N = round(T/h)
+    for i in range(N):
+        # active leg, cross-track and along-track position
+        p1,alpha,length,e,s = _leg(waypoints,rows,leg,x)
+
+        # waypoint switching; the switched routes are measured and steered on their new leg
+        reached = active & ((np.hypot(x[3]-p1[:,0],x[4]-p1[:,1]) < acceptance) | (s >= length))
+        leg = np.where(reached,leg+1,leg)
+        done = reached & (leg >= last)
+        arrival = np.where(done,i*h,arrival)
+        active = active & ~done
+        if not active.any():
+            break
+        k = np.flatnonzero(reached & active)
+        if len(k):
+            p1[k],alpha[k],length[k],e[k],s[k] = _leg(waypoints[k],np.arange(len(k)),leg[k],x[:,k])
+
+        ae = np.abs(e)
+        n += active
+        sum_e += np.where(active,ae,0)
+        sum_e2 += np.where(active,e*e,0)
+        max_e = np.where(active,np.maximum(max_e,ae),max_e)
+
+        # LOS guidance and PD autopilot
+        psi_d = alpha+np.arctan(-e/lookahead)
+        u = np.clip(Kp*wrap(psi_d-x[5])-Kd*x[2],-u_max,u_max)
+        xdot,U = f(x,u,U0,coeffs)
+        x = x+h*np.array(xdot)
+
+    n_safe = np.maximum(n,1)
+    stats = {'mean': sum_e/n_safe, 'rms': np.sqrt(sum_e2/n_safe), 'max': max_e,
+             'arrival': arrival, 'legs': leg}
+    return stats,n.sum()*h
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    for R in (100,1000,5000):
+        waypoints,count = random_routes(rng,R)
+        t0 = timer.perf_counter()
+        stats,seconds = follow(waypoints,count,T = 4*3600)
+        wall = timer.perf_counter()-t0
+        done = np.isfinite(stats['arrival'])
+        print("R = %5d : %.0f ship-hours in %.1f s -> %.0f ship-hours per wall-second   (%d%% of the routes completed)" %
+              (R,seconds/3600,wall,seconds/3600/wall,100*done.mean()))
+        print("          cross-track error mean %.1f m, RMS %.1f m, max %.1f m (median over routes)" %
+              (np.median(stats['mean']),np.median(stats['rms']),np.median(stats['max'])))
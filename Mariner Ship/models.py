@@ -0,0 +1,161 @@
+"""
+Vessel model registry
+
+Every vessel model exposes the same interface:
+
+    model.name          : registry name, e.g. 'mariner'
+    model.state         : names of the state vector
+    model.U0            : nominal speed (m/s)
+    model.L             : length (m)
+    model.coefficients  : coefficient table (dict)
+    model.activate      : xdot,U = model.activate(x,ui[,U0,coeffs]), with x of shape (n,K) for
+                          a batch of K ships, same signature as mariner.activate; the
+                          model's coefficient table is used when coeffs is None
+    model.function      : the same function (alias)
+    model.derivative    : xdot = model.derivative(x,ui), xdot as an (n,K) array
+
+model_hash(ship,coeffs) identifies a model and coefficient table, e.g. in the
+run catalog and the codegen cache.
+
+The drivers resolve the `ship` argument once with models.get(ship) and call
+model.activate (or model.function) in the loop. For the default coefficient
+table it *is* the module function (no wrapper), so the registry adds no
+per-step cost; a model of with_coefficients() wraps it once to substitute its
+table.
+
+A Fossen-style model (container ship, tanker, ...) is plugged in by writing a
+module with the same activate(x,ui,U0,coeffs) function as mariner.py and
+registering it:
+
+    models.register(VesselModel('tanker',tanker.activate,tanker.coefficients,
+                                 ['u','v','r','x','y','psi','delta','n'],U0 = 8.23,L = 304.8))
+
+"""
+
+import hashlib
+import json
+import time as timer
+import numpy as np
+import mariner
+
+
+def _with_table(function,table,U0):
+    """ Model function using `table` when no coefficient table is passed """
+    def activate(x,ui,U0 = U0,coeffs = None):
+        return function(x,ui,U0,table if coeffs is None else coeffs)
+    return activate
+
+
+class VesselModel:
+
+    def __init__(self,name,activate,coefficients,state,U0,L):
+        """
+        Parameters
+        ----------
+        name         : registry name
+        activate     : model function xdot,U = activate(x,ui,U0 = ..., coeffs = None)
+        coefficients : default coefficient table of the model
+        state        : names of the state vector
+        U0           : nominal speed (m/s)
+        L            : length (m)
+        """
+        self.name = name
+        self.state = list(state)
+        self.U0 = U0
+        self.L = L
+        self.base = activate
+        self.defaults = coefficients
+        self.coefficients = coefficients
+        self.activate = self.function = activate
+
+    def with_coefficients(self,coeffs):
+        """ Copy of the model with some coefficients replaced (e.g. fitted by sysid) """
+        table = dict(self.coefficients)
+        table.update(coeffs)
+        model = VesselModel(self.name,self.base,self.defaults,self.state,self.U0,self.L)
+        model.coefficients = table
+        model.activate = model.function = _with_table(self.base,table,self.U0)
+        return model
+
+    def derivative(self,x,ui,U0 = None):
+        """ Batched state derivative as an (n,K) array """
+        xdot,U = self.activate(x,ui,self.U0 if U0 is None else U0)
+        return np.array(xdot)
+
+    def __repr__(self):
+        return "VesselModel(%r, %d states)" % (self.name,len(self.state))
+
+
+_registry = {}
+
+
+def register(model):
+    """ Adds (or replaces) a model in the registry """
+    _registry[model.name] = model
+    return model
+
+
+def get(ship):
+    """ Resolves a ship name (or returns a VesselModel as is) """
+    if isinstance(ship,VesselModel):
+        return ship
+    try:
+        return _registry[ship]
+    except KeyError:
+        raise KeyError("Unknown ship model %r, available: %s" % (ship,", ".join(sorted(_registry)))) from None
+
+
+def available():
+    """ Names of the registered models """
+    return sorted(_registry)
+
+
+def model_hash(ship = 'mariner',coeffs = None):
+    """ Short hash of a model's state names and coefficient table (coeffs overrides entries) """
+    model = get(ship)
+    table = dict(model.coefficients)
+    table.update(coeffs or {})
+    text = json.dumps([model.name,model.state,
+                       sorted((k,np.asarray(v).tolist()) for k,v in table.items())])
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+register(VesselModel('mariner',mariner.activate,mariner.coefficients,
+                     ['u','v','r','x','y','psi','delta'],U0 = 7.7175,L = mariner.L))
+
+
+def benchmark(ship,K = 1,steps = 2000,h = 0.1):
+    """
+    Time per step of an Euler loop calling the module function with an explicit
+    coefficient table and a with_coefficients() model of the same table
+
+    Returns
+    -------
+    (direct, registry) : seconds per step
+    """
+    model = get(ship)
+    custom = model.with_coefficients({})
+    table = custom.coefficients
+    direct = lambda x,ui: model.base(x,ui,model.U0,table)
+    x0 = np.zeros((len(model.state),K))
+    ui = np.full(K,0.2)
+    times,final = {},{}
+    # alternated and repeated, the best of three is kept for each
+    for f,key in 3*[(direct,'direct'),(custom.activate,'registry')]:
+        x = x0.copy()
+        t0 = timer.perf_counter()
+        for i in range(steps):
+            xdot,U = f(x,ui)
+            x = x+h*np.array(xdot)
+        times[key] = min(times.get(key,np.inf),(timer.perf_counter()-t0)/steps)
+        final[key] = x
+    assert np.array_equal(final['direct'],final['registry'])
+    return times['direct'],times['registry']
+
+
+if __name__ == "__main__":
+    for name in available():
+        for K in (1,1000):
+            direct,registry = benchmark(name,K)
+            print("%-10s K = %5d   direct : %7.2f us/step   registry : %7.2f us/step" %
+                  (name,K,direct*1e6,registry*1e6))
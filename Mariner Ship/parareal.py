@@ -0,0 +1,241 @@
+"""
+Parareal parallel-in-time integration of one long maneuver
+
+A single long run (the 5300 s spiral test, a passage of hours) is a
+sequential chain of Euler steps. Parareal cuts the time span into slices and iterates
+
+    U[k+1] <- G(U[k]) + F(U_old[k]) - G(U_old[k])
+
+where F is the accurate fine propagator (Euler with the drivers' step h)
+over one slice and G a cheap coarse propagator (Euler with a large step H).
+The fine solves of all slices are independent and run concurrently in a
+process pool, the coarse sweep is sequential but H/h times cheaper. After
+iteration k the first k slices are exact, so the iteration always
+terminates; it stops as soon as the slice start states change by less than
+`tol` (mixed absolute/relative).
+
+The rudder command is a function of the time, so that every slice can be
+started on its own. It is evaluated at the drivers' time of step i, (i-1)*h,
+and the rows carry that time, so the result matches the drivers' loops
+row by row: spiral_command() is the schedule of Spiral Test/spiral.py and
+turning_circle_command() the one of precision.turning_circle:
+
+    traj,info = parareal.parareal(np.zeros(7),parareal.spiral_command,5300,slices = 16)
+
+"""
+
+import importlib.util
+import multiprocessing
+import os
+import sys
+import time as timer
+import numpy as np
+import models
+from recorders import COLUMNS
+from trajectory import Trajectory
+
+SPIRAL_DRIVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir,'Spiral Test','spiral.py')
+
+# Spiral Test/spiral.py: ui from t_rudderexecute on, then SPIRAL_TIMES[k] < time <= SPIRAL_TIMES[k+1]
+# is sailed with 6+k deg, up to 35 deg at 5300 s
+SPIRAL_TIMES = [500,900,1300,1600,1850,2050,2250,2450,2650,2850,3050,3200,3350,3500,3650,3800]+list(range(3900,5301,100))
+
+
+def spiral_command(time,ui = 5*np.pi/180,t_rudderexecute = 10):
+    """ Rudder command (rad) of the spiral test of Spiral Test/spiral.py at the drivers' times `time` """
+    time = np.asarray(time)
+    k = np.searchsorted(SPIRAL_TIMES,time,side='left')          #steps passed before time
+    u = np.where((k == 0) | (k == len(SPIRAL_TIMES)),ui,((k+5)*np.pi)/180)
+    return np.where(np.round(time) < t_rudderexecute,0.0,u)
+
+
+def turning_circle_command(time,rudder = -35,t_rudderexecute = 100):
+    """ Rudder command (rad) of precision.turning_circle at the drivers' times `time` """
+    return np.where(np.round(time) < t_rudderexecute,0.0,rudder*np.pi/180)
+
+
+def spiral_driver():
+    """ The module Spiral Test/spiral.py, loaded with the mariner.py of its own directory """
+    directory = os.path.dirname(SPIRAL_DRIVER)
+    saved = sys.modules.pop('mariner',None)
+    sys.path.insert(0,directory)
+    try:
+        spec = importlib.util.spec_from_file_location('spiral',SPIRAL_DRIVER)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(directory)
+        sys.modules.pop('mariner',None)
+        if saved is not None:
+            sys.modules['mariner'] = saved
+    return module
+
+
+def fine(x,i0,i1,h,command,U0 = 7.7175,ship = 'mariner',coeffs = None,rows = False):
+    """
+    Fine propagator: Euler steps i0..i1-1 of size h from the state x (7,)
+
+    Returns
+    -------
+    x    : (7,) state after step i1-1
+    data : (i1-i0, 9) rows [time,u,v,r,x,y,psi,U,ui] after every step (rows = True), or None,
+           with the drivers' time (i-1)*h of step i
+    """
+    f = models.get(ship).function
+    x = np.array(x,dtype=float).reshape(-1,1)
+    time = (np.arange(i0,i1)-1)*h
+    ui = command(time)
+    data = np.empty((i1-i0,len(COLUMNS))) if rows else None
+    for i in range(i1-i0):
+        xdot,U = f(x,ui[i],U0,coeffs)
+        x = x+h*np.array(xdot)
+        if rows:
+            data[i,0] = time[i]
+            data[i,1:7] = x[:6,0]
+            data[i,7] = U[0]
+            data[i,8] = ui[i]
+    return x[:,0],data
+
+
+def coarse(x,i0,i1,h,H,command,U0 = 7.7175,ship = 'mariner',coeffs = None):
+    """ Coarse propagator: the span of fine steps i0..i1-1 in Euler steps of about H """
+    f = models.get(ship).function
+    m = max(1,round((i1-i0)*h/H))
+    H = (i1-i0)*h/m
+    ui = command((i0-1)*h+np.arange(m)*H)
+    x = np.array(x,dtype=float).reshape(-1,1)
+    for j in range(m):
+        xdot,U = f(x,ui[j],U0,coeffs)
+        x = x+H*np.array(xdot)
+    return x[:,0]
+
+
+def _fine(task):
+    """ Pool worker: one fine slice, timed """
+    t0 = timer.perf_counter()
+    x,data = fine(*task[:-1],**task[-1],rows = True)
+    return x,data,timer.perf_counter()-t0
+
+
+def sequential(x0,command,T,h = 0.1,U0 = 7.7175,ship = 'mariner',coeffs = None):
+    """ The whole run with the fine propagator in this process (the drivers' loop) """
+    x,data = fine(x0,0,round(T/h),h,command,U0,ship,coeffs,rows = True)
+    return Trajectory(data,U0)
+
+
+def parareal(x0,command,T,h = 0.1,H = 1.5,slices = None,tol = 1e-8,max_iter = None,workers = None,
+             U0 = 7.7175,ship = 'mariner',coeffs = None,pool = None):
+    """
+    Parareal solution of one run
+
+    Parameters
+    ----------
+    x0       : (7,) initial state
+    command  : rudder command ui = command(time) (rad) at the drivers' times, e.g. spiral_command
+    T, h     : simulated time and fine step (sec)
+    H        : coarse step (sec), below 2 s for the Euler step of the rudder servo to stay stable
+    slices   : number of time slices, default the number of workers
+    tol      : convergence tolerance on the slice start states, max |dU|/(1+|U|)
+    max_iter : iteration limit, default slices (exact after that many)
+    workers  : process pool size, default os.cpu_count(); 1 runs the slices in this process
+
+    Returns
+    -------
+    traj : Trajectory of [time,u,v,r,x,y,psi,U,ui] after every fine step
+    info : dict with 'iterations', 'error' (per iteration), 'wall', 'coarse' (seconds of the
+           coarse sweeps) and 'fine' (per iteration, the seconds of every fine slice solved)
+    """
+    t_start = timer.perf_counter()
+    workers = workers or os.cpu_count()
+    P = slices or workers
+    max_iter = min(max_iter or P,P)
+    bounds = np.linspace(0,round(T/h),P+1).round().astype(int)
+    model_args = {'U0': U0,'ship': ship,'coeffs': coeffs}
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = multiprocessing.Pool(min(workers,P))
+
+    t0 = timer.perf_counter()
+    U = np.empty((P+1,len(np.ravel(x0))))
+    U[0] = np.ravel(x0)
+    G = np.empty((P,U.shape[1]))
+    for k in range(P):
+        G[k] = coarse(U[k],bounds[k],bounds[k+1],h,H,command,**model_args)
+        U[k+1] = G[k]
+    info = {'iterations': 0,'error': [],'coarse': [timer.perf_counter()-t0],'fine': []}
+    data = [None]*P
+    try:
+        for it in range(1,max_iter+1):
+            # slices before it-1 start from exact states and were solved already
+            tasks = [(U[k],bounds[k],bounds[k+1],h,command,model_args)
+                     for k in range(it-1,P)]
+            results = pool.map(_fine,tasks) if pool is not None else [_fine(t) for t in tasks]
+            info['fine'].append([r[2] for r in results])
+            for k,r in zip(range(it-1,P),results):
+                data[k] = r[1]
+
+            t0 = timer.perf_counter()
+            new = U.copy()
+            new[it] = results[0][0]
+            for k in range(it,P):
+                g = coarse(new[k],bounds[k],bounds[k+1],h,H,command,**model_args)
+                new[k+1] = g+results[k-it+1][0]-G[k]
+                G[k] = g
+            info['coarse'].append(timer.perf_counter()-t0)
+            error = np.max(np.abs(new-U)/(1+np.abs(new)))
+            info['error'].append(error)
+            info['iterations'] = it
+            U = new
+            if error < tol:
+                break
+    finally:
+        if own_pool:
+            pool.close()
+            pool.join()
+    info['wall'] = timer.perf_counter()-t_start
+    return Trajectory(np.concatenate(data),U0),info
+
+
+def critical_path(info):
+    """
+    Projected run time of the parareal iteration with one core per slice: coarse sweeps + slowest
+    slice per iteration, from the timings of this run (an estimate, not a measurement)
+    """
+    return sum(info['coarse'])+sum(max(f) for f in info['fine'])
+
+
+if __name__ == "__main__":
+    import precision
+
+    # the sequential references are the drivers themselves: their loops, commands and time convention
+    spiral = spiral_driver()
+    h = 0.1
+
+    def run_spiral():
+        t,u,v,r,x,y,psi,U,delta_c = spiral.activate('mariner',np.zeros((7,1)),5*np.pi/180,5300,10,h)
+        return np.column_stack((t,x,y,psi*np.pi/180))[:-1]
+
+    def run_turning_circle():
+        TC = precision.turning_circle(np.zeros((7,1)),1000,100,h)
+        return TC.data[:,[0,4,5,6]]
+
+    workers = os.cpu_count()
+    scenarios = {'spiral (5300 s)': (run_spiral,spiral_command,5300.0),
+                 'turning circle (1000 s)': (run_turning_circle,turning_circle_command,1000.0)}
+    print("%d worker process(es)" % workers)
+    for name,(driver,command,T) in scenarios.items():
+        t0 = timer.perf_counter()
+        ref = driver()
+        t_seq = timer.perf_counter()-t0
+        for slices in (16,32,64):
+            traj,info = parareal(np.zeros(7),command,T,h,slices = slices,tol = 1e-8,workers = workers)
+            rows = traj.data[:,[0,4,5,6]]
+            assert np.array_equal(rows[:,0],ref[:,0])
+            position = np.hypot(*(rows[:,1:3]-ref[:,1:3]).T).max()
+            psi = np.abs(rows[:,3]-ref[:,3]).max()
+            print("%-24s %2d slices : %2d iterations, driver %.2f s, measured with %d worker(s) %.2f s "
+                  "(speedup %.2fx)" % (name,slices,info['iterations'],t_seq,workers,info['wall'],t_seq/info['wall']))
+            print("%-24s            projected with %d cores (critical path, not measured) %.2f s (speedup %.2fx)" %
+                  ("",slices,critical_path(info),t_seq/critical_path(info)))
+            print("%-24s            max deviation from the driver : position %.1e m, psi %.1e rad" %
+                  ("",position,psi))
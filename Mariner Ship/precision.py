@@ -0,0 +1,120 @@
+"""
+Validation report of the precision modes (mariner.PRECISION)
+
+Runs a 20/20 zig-zag through zig_zag.activate and a 35 deg turning circle in
+every precision mode and reports the drift of the standard maneuvering metrics
+and the memory of the recorded output against the float64 reference.
+
+"""
+
+import numpy as np
+import mariner
+import models
+import recorders
+from trajectory import Trajectory
+import zig_zag
+import zig_zag_metrics as zig_zag_metrics_batch
+
+
+def crossing(a,level,values):
+    """ Values linearly interpolated at the first sample where a reaches level """
+    k = int(np.argmax(a >= level))
+    if a[k] < level or k == 0:
+        return np.nan
+    w = (level-a[k-1])/(a[k]-a[k-1])
+    return values[k-1]+w*(values[k]-values[k-1])
+
+
+def turning_metrics(x,y,psi,t,t_rudderexecute):
+    """
+    Advance and transfer at 90 deg heading change and tactical diameter at 180 deg
+
+    Parameters
+    ----------
+    x,y   : position (m)
+    psi   : yaw angle (deg)
+    t     : time vector (sec)
+    t_rudderexecute : time the rudder is executed (sec)
+
+    """
+    x = np.asarray(x,dtype=float)
+    y = np.asarray(y,dtype=float)
+    psi = np.abs(np.asarray(psi,dtype=float))
+    k0 = int(np.argmax(np.asarray(t) >= t_rudderexecute))
+    return {'advance'  : abs(crossing(psi,90,x)-x[k0]),
+            'transfer' : abs(crossing(psi,90,y)-y[k0]),
+            'tactical' : abs(crossing(psi,180,y)-y[k0])}
+
+
+def zig_zag_metrics(psi,delta_c,t,heading = 20):
+    """
+    First and second overshoot angles (deg) and initial turning time (sec) of a zig-zag
+
+    Parameters
+    ----------
+    psi     : yaw angle (deg)
+    delta_c : commanded rudder angle (deg)
+    t       : time vector (sec)
+    heading : heading angle of the zig-zag (deg)
+
+    """
+    metrics = zig_zag_metrics_batch.extract(np.asarray(psi,dtype=float),np.asarray(delta_c,dtype=float),
+                                            np.asarray(t,dtype=float),heading)
+    return {k: float(metrics[k][0]) for k in ('overshoot_1','overshoot_2','turning_time')}
+
+
+def turning_circle(x,Req_simulation_time,t_rudderexecute,h,rudder = -35,precision = 'float64',
+                   recorder = None,ship = 'mariner'):
+    """
+    Turning circle with the zig-zag driver's model, integrator and recorder
+
+    Returns
+    -------
+    traj : Trajectory of [time, u, v, r, x, y, psi, U, ui], or the dict of
+           recorders.SummaryRecorder
+
+    """
+    N = round(Req_simulation_time/h)
+    state_type,output_type = mariner.PRECISION[precision]
+    recorder = recorders.FullRecorder() if recorder is None else recorder
+    recorder.start(N,output_type)
+    x = np.asarray(x,dtype=state_type)
+    model = models.get(ship)
+    ship_activate = model.activate
+    for i in range(N):
+        time = (i-1)*h
+        u_ship = 0.0 if round(time) < t_rudderexecute else rudder*np.pi/180
+        xdot,U = ship_activate(x,state_type(u_ship))
+        x = zig_zag.euler_integration(xdot,x,h)
+        recorder.record(i,np.hstack([time,x[:6,0],U[0],u_ship]))
+    xout = recorder.result()
+    return Trajectory(xout,model.U0) if isinstance(xout,np.ndarray) else xout
+
+
+def report(h = 0.1):
+    """ Prints (and returns) the metrics of every precision mode and their drift against float64 """
+    results = {}
+    for precision in mariner.PRECISION:
+        xt = np.zeros((7,1))
+        ZZ = zig_zag.activate('mariner',xt,0,1000,10,h,[20,20],precision)
+        metrics = zig_zag_metrics(ZZ.psi_deg,ZZ.delta_deg,ZZ.t)
+        metrics['zig_zag_final_x'] = float(ZZ.x[-1])
+        metrics['zig_zag_final_y'] = float(ZZ.y[-1])
+        TC = turning_circle(np.zeros((7,1)),1000,100,h,precision = precision)
+        metrics.update(turning_metrics(TC.x,TC.y,TC.psi_deg,TC.t,100))
+        metrics['xout_bytes'] = ZZ.data.nbytes+TC.data.nbytes
+        results[precision] = metrics
+
+    print("%-16s %14s" % ("metric","float64")+"".join("%14s %11s" % (p,"drift") for p in results if p != 'float64'))
+    for key in results['float64']:
+        ref = results['float64'][key]
+        line = "%-16s %14.6f" % (key,ref)
+        for p in results:
+            if p != 'float64':
+                line += "%14.6f %11.3e" % (results[p][key],results[p][key]-ref)
+        print(line)
+    return results
+
+
+if __name__ == "__main__":
+    report()
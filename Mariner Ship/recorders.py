@@ -0,0 +1,132 @@
+"""
+Recording policies for the simulation loop
+
+The drivers hand every sample row
+
+    [time, u, v, r, x, y, psi, U, ui]
+
+to a recorder instead of writing it into a preallocated (N x 9) matrix, so
+the memory of a run follows what the caller keeps rather than N:
+
+    FullRecorder       : every sample, the (N x 9) xout matrix
+    DecimatingRecorder : every k-th sample (k = 10 gives a 1 Hz track at h = 0.1 s)
+    EventRecorder      : samples at rudder switches and heading extrema only
+    SummaryRecorder    : running statistics of every column, no trajectory
+
+A recorder is used as
+
+    recorder.start(N,dtype)      # before the loop, N = number of samples
+    recorder.record(i,row)       # every step
+    recorder.result()            # after the loop
+
+"""
+
+import numpy as np
+
+COLUMNS = ['time','u','v','r','x','y','psi','U','ui']
+
+
+class FullRecorder:
+    """ Keeps every sample, result() is the (N x 9) xout matrix """
+
+    def start(self,N,dtype = np.float64):
+        self.xout = np.zeros((N,len(COLUMNS)),dtype=dtype)
+
+    def record(self,i,row):
+        self.xout[i,:] = row
+
+    def result(self):
+        return self.xout
+
+
+class DecimatingRecorder:
+    """ Keeps every k-th sample (i = 0, k, 2k, ...), result() is a ((N-1)//k+1 x 9) matrix """
+
+    def __init__(self,k):
+        self.k = int(k)
+
+    def start(self,N,dtype = np.float64):
+        self.xout = np.zeros(((N-1)//self.k+1,len(COLUMNS)),dtype=dtype)
+
+    def record(self,i,row):
+        if i % self.k == 0:
+            self.xout[i//self.k,:] = row
+
+    def result(self):
+        return self.xout
+
+
+class EventRecorder:
+    """
+    Keeps the first and last sample, the samples where the commanded rudder
+    changes and the heading extrema (sign change of the yaw rate).
+
+    result() is the (n_events x 9) matrix of those samples, `events` holds the
+    kind of every row: 'start', 'rudder', 'extremum' or 'end'.
+    """
+
+    def start(self,N,dtype = np.float64):
+        self.dtype = dtype
+        self.rows, self.kinds = [],[]
+        self.events = []
+        self.previous = None
+
+    def record(self,i,row):
+        previous = self.previous
+        if previous is None:
+            kind = 'start'
+        elif row[8] != previous[8]:
+            kind = 'rudder'
+        elif row[3]*previous[3] < 0 or (previous[3] != 0 and row[3] == 0):
+            kind = 'extremum'
+        else:
+            kind = None
+        if kind is not None:
+            self.rows.append(np.array(row,dtype=self.dtype))
+            self.kinds.append(kind)
+        self.previous, self.kept = row, kind is not None
+
+    def result(self):
+        rows, self.events = list(self.rows), list(self.kinds)
+        if self.previous is not None and not self.kept:
+            rows.append(np.array(self.previous,dtype=self.dtype))
+            self.events.append('end')
+        return np.array(rows,dtype=self.dtype).reshape(-1,len(COLUMNS))
+
+
+class SummaryRecorder:
+    """
+    Keeps running statistics of every column (Welford's algorithm), memory is
+    independent of N. result() is a dict of arrays indexed like COLUMNS:
+    count, min, max, mean, std, first and last.
+    """
+
+    def start(self,N,dtype = np.float64):
+        self.n = 0
+        self.min = np.full(len(COLUMNS),np.inf)
+        self.max = np.full(len(COLUMNS),-np.inf)
+        self.mean = np.zeros(len(COLUMNS))
+        self.m2 = np.zeros(len(COLUMNS))
+        self.first = self.last = None
+
+    def record(self,i,row):
+        row = np.asarray(row,dtype=np.float64)
+        if self.first is None:
+            self.first = row
+        self.last = row
+        self.n += 1
+        np.minimum(self.min,row,out=self.min)
+        np.maximum(self.max,row,out=self.max)
+        d = row-self.mean
+        self.mean += d/self.n
+        self.m2 += d*(row-self.mean)
+
+    def result(self):
+        return {'columns' : COLUMNS,
+                'count'   : self.n,
+                'min'     : self.min,
+                'max'     : self.max,
+                'mean'    : self.mean,
+                'std'     : np.sqrt(self.m2/max(self.n,1)),
+                'first'   : self.first,
+                'last'    : self.last}
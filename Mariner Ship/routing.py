@@ -0,0 +1,212 @@
+"""
+Isochrone weather routing of a Mariner-class ship
+
+Every stage expands each point of the current isochrone over a fan of
+candidate headings and propagates all candidates at once with one batched
+rollout of the hull model: a PD autopilot turns the ship to the candidate
+heading and the wind of the weather field at the stage start acts through
+disturbances.Disturbance (apparent wind, so the speed loss depends on the
+heading relative to the wind) together with the current. The rollout covers the first `settle`
+seconds of the stage, the rest of the stage is sailed at the velocity
+reached at its end.
+
+The new candidates are pruned with a spatial grid: the plane is divided into
+cross-track bins of the start-destination line and only the candidate with
+the largest along-track progress of every bin survives (the others are
+dominated). The route is recovered by following the parent indices back
+from the first candidate that reaches the destination.
+
+Coordinates are flat-earth x (north), y (east) in m, time in sec.
+
+"""
+
+import time as timer
+import numpy as np
+import disturbances
+import mariner
+import models
+from rollout import wrap
+
+
+def example_weather(x,y,t,center = (600e3,300e3),velocity = (2.0,4.0),V_max = 22.0,R_max = 150e3,
+                    background = (8.0,np.pi/2),eddy = (600e3,300e3,120e3,2.0)):
+    """
+    Example weather field: a moving cyclone (counter-clockwise wind) on a steady
+    background wind, and a clockwise current eddy (center x, y, radius, speed)
+
+    Returns
+    -------
+    V, direction   : wind speed (m/s) and direction the wind travels to (rad), arrays like x
+    Vc, current_dir: current speed (m/s) and direction (rad)
+    """
+    dx = x-(center[0]+velocity[0]*t)
+    dy = y-(center[1]+velocity[1]*t)
+    r = np.hypot(dx,dy)+1.0
+    V = V_max*(r/R_max)*np.exp(1-r/R_max)
+    wx = -V*dy/r+background[0]*np.cos(background[1])
+    wy = V*dx/r+background[0]*np.sin(background[1])
+    ex,ey = x-eddy[0],y-eddy[1]
+    re = np.hypot(ex,ey)+1.0
+    Vc = eddy[3]*(re/eddy[2])*np.exp(1-re/eddy[2])
+    return np.hypot(wx,wy),np.arctan2(wy,wx),Vc,np.arctan2(-ex,ey)
+
+
+def propagate(state,heading,t,weather,duration,settle = 600.0,h = 2.0,Kp = 3.0,Kd = 60.0,
+              rudder_max = 35.0,U0 = 7.7175,ship = 'mariner'):
+    """
+    Batched stage rollout
+
+    Parameters
+    ----------
+    state   : (7,K) states at the stage start
+    heading : (K,) candidate headings (rad)
+    t       : stage start time (sec), wind and current are taken at the start position and time
+    weather : weather(x,y,t) -> wind speed, wind direction, current speed, current direction
+              (see example_weather)
+    h       : rollout step (sec), the rudder servo is advanced exactly (mariner.rudder_step)
+              since its 1 s lag is unstable under an Euler step this large
+
+    Returns
+    -------
+    state : (7,K) states at the end of the stage
+    """
+    f = models.get(ship).function
+    K = state.shape[1]
+    V,direction,Vc,current_dir = weather(state[3],state[4],t)
+    current = Vc*np.array([np.cos(current_dir),np.sin(current_dir)])
+    dist = disturbances.Disturbance(np.zeros((3,K,1)),V[:,None],direction,current,U0)
+    u_max = rudder_max*np.pi/180
+    x = state.copy()
+    x[5] = wrap(x[5])
+    n = round(min(settle,duration)/h)
+    for i in range(n):
+        u = np.clip(Kp*wrap(heading-x[5])-Kd*x[2],-u_max,u_max)
+        xdot,U = f(x,u,U0)
+        xdot = dist.apply(0,x,xdot)
+        delta = x[6]
+        x = x+h*np.array(xdot)
+        x[6] = mariner.rudder_step(delta,u,h)
+    # rest of the stage at the velocity over ground reached at the end of the rollout
+    u = np.clip(Kp*wrap(heading-x[5])-Kd*x[2],-u_max,u_max)
+    xdot,U = f(x,u,U0)
+    xdot = dist.apply(0,x,xdot)
+    x[3] = x[3]+(duration-n*h)*xdot[3]
+    x[4] = x[4]+(duration-n*h)*xdot[4]
+    return x
+
+
+def route(start,destination,weather,stage = 3600.0,headings = 61,fan = 90.0,bins = 120,
+          radius = 5e3,max_stages = 200,**kwargs):
+    """
+    Fastest route from start to destination through the weather field
+
+    Parameters
+    ----------
+    start, destination : (x, y) positions (m)
+    stage              : isochrone time step (sec)
+    headings           : candidate headings per isochrone point
+    fan                : candidates span +-fan deg around the bearing to the destination
+    bins               : cross-track bins of the pruning grid (maximum isochrone size)
+    radius             : the destination is reached by passing within radius (m)
+
+    Returns
+    -------
+    path    : (S+1, 2) positions of the route at the isochrones, destination last
+    time    : passage time (sec)
+    timing  : dict of per-stage lists, 'expand' (rollout) and 'prune' seconds, 'points'
+
+    """
+    start,destination = np.asarray(start,dtype=float),np.asarray(destination,dtype=float)
+    d = destination-start
+    distance = np.hypot(*d)
+    along,across = d/distance,np.array([-d[1],d[0]])/distance
+    width = 2*distance                                   #cross-track extent of the grid
+    fan_offsets = np.radians(np.linspace(-fan,fan,headings))
+
+    state = np.zeros((7,1))
+    state[3],state[4] = start
+    state[5] = np.arctan2(d[1],d[0])
+    positions,parents = [state[3:5].T.copy()],[]
+    timing = {'expand': [], 'prune': [], 'points': []}
+
+    for k in range(max_stages):
+        t0 = timer.perf_counter()
+        P = state.shape[1]
+        bearing = np.arctan2(destination[1]-state[4],destination[0]-state[3])
+        heading = (bearing[:,None]+fan_offsets).ravel()
+        parent = np.repeat(np.arange(P),headings)
+        new = propagate(state[:,parent],heading,k*stage,weather,stage,**kwargs)
+        t1 = timer.perf_counter()
+
+        # arrival: candidates whose stage segment passes within radius of the destination
+        p0,p1 = state[3:5,parent].T,new[3:5].T
+        seg = p1-p0
+        w = np.clip(np.sum((destination-p0)*seg,axis=1)/np.maximum(np.sum(seg*seg,axis=1),1e-9),0,1)
+        miss = np.hypot(*(p0+w[:,None]*seg-destination).T)
+        arrived = miss < radius
+        if arrived.any():
+            j = np.flatnonzero(arrived)[np.argmin(w[arrived])]
+            timing['expand'].append(t1-t0)
+            timing['prune'].append(timer.perf_counter()-t1)
+            timing['points'].append(P)
+            path = [destination]
+            i = parent[j]
+            for s in range(len(parents)-1,-1,-1):
+                path.append(positions[s+1][i])
+                i = parents[s][i]
+            path.append(start)
+            return np.array(path[::-1]),(k+w[j])*stage,timing
+
+        # pruning on the spatial grid: best along-track progress per cross-track bin
+        rel = p1-start
+        progress = rel@along
+        b = np.floor((rel@across+width/2)/width*bins).astype(int)
+        keep = (b >= 0) & (b < bins)
+        idx = np.flatnonzero(keep)
+        order = idx[np.lexsort((-progress[idx],b[idx]))]
+        first = np.ones(len(order),dtype=bool)
+        first[1:] = b[order][1:] != b[order][:-1]
+        survivors = order[first]
+        t2 = timer.perf_counter()
+
+        state = new[:,survivors]
+        parents.append(parent[survivors])
+        positions.append(state[3:5].T.copy())
+        timing['expand'].append(t1-t0)
+        timing['prune'].append(t2-t1)
+        timing['points'].append(P)
+    raise RuntimeError("destination not reached in %d stages" % max_stages)
+
+
+def sail(start,destination,weather,stage = 3600.0,max_stages = 200,**kwargs):
+    """ Passage time on the direct line (heading to the destination at every stage), for comparison """
+    start,destination = np.asarray(start,dtype=float),np.asarray(destination,dtype=float)
+    state = np.zeros((7,1))
+    state[3],state[4] = start
+    state[5] = np.arctan2(*(destination-start)[::-1])
+    for k in range(max_stages):
+        p0 = state[3:5,0].copy()
+        bearing = np.arctan2(destination[1]-p0[1],destination[0]-p0[0])
+        state = propagate(state,np.array([bearing]),k*stage,weather,stage,**kwargs)
+        seg = state[3:5,0]-p0
+        remaining = np.hypot(*(destination-p0))
+        if np.hypot(*seg) >= remaining:
+            return (k+remaining/np.hypot(*seg))*stage
+    return np.inf
+
+
+if __name__ == "__main__":
+    start, destination = (0.0,0.0), (1200e3,600e3)          #about 1340 km, 2 days at 15 knots
+
+    t0 = timer.perf_counter()
+    path,time,timing = route(start,destination,example_weather)
+    wall = timer.perf_counter()-t0
+    direct = sail(start,destination,example_weather)
+    print("Isochrone route : %.1f h (direct line %.1f h), %d stages planned in %.1f s" %
+          (time/3600,direct/3600,len(timing['points']),wall))
+    print("  per stage : expand (batched rollout) %.2f s, prune %.1f ms, isochrone up to %d points (%d candidates)" %
+          (np.mean(timing['expand']),np.mean(timing['prune'])*1e3,max(timing['points']),max(timing['points'])*61))
+    for s in range(0,len(path),4):
+        V,_,Vc,_ = example_weather(path[s,0],path[s,1],s*3600.0)
+        print("  stage %3d  x %8.1f km  y %8.1f km  wind %5.1f m/s  current %4.1f m/s" %
+              (s,path[s,0]/1e3,path[s,1]/1e3,V,Vc))
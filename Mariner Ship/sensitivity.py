@@ -0,0 +1,196 @@
+"""
+Forward sensitivity analysis of the Mariner model
+
+The variational equations of the Euler scheme
+
+    x[k+1] = x[k] + h*f(x[k],theta)
+    S[k+1] = S[k] + h*(df/dx S[k] + df/dtheta),      S = dx/dtheta
+
+are integrated together with the state in a single run. The directional
+derivatives df/dx S[:,j] + df/dtheta e_j of all parameters j are evaluated
+with one batched, complex-step call of the model per step, which is exact to
+rounding (no step-size trade-off as with finite differences). mariner.activate
+is complex-step safe: np.clip keeps the imaginary part inside the limits and
+zeroes it when the rudder saturates.
+
+Parameters can be any entry of the coefficient table and 'ui', an offset
+added to the commanded rudder angle (rad) over the whole run.
+
+"""
+
+import time as timer
+import numpy as np
+import models
+import sysid
+
+PARAMETERS = sysid.X_TERMS+sysid.Y_TERMS+sysid.N_TERMS+['ui']
+
+EPS = 1e-30     #complex step
+
+
+def jacobian(x,ui,U0 = 7.7175,ship = 'mariner',coeffs = None):
+    """
+    Exact state Jacobians of a batch of ships by complex step
+
+    Parameters
+    ----------
+    x  : (n,K) states
+    ui : commanded rudder angle (rad), scalar or (K,)
+    U0 : nominal speed, scalar or (K,)
+
+    Returns
+    -------
+    f : (n,K) state derivative
+    J : (K,n,n) df/dx
+
+    """
+    model = models.get(ship)
+    x = np.asarray(x,dtype=float)
+    n,K = x.shape
+    z = np.repeat(x,n,axis=1).astype(complex)                    #column k*n+j perturbs state j of ship k
+    z[np.tile(np.arange(n),K),np.arange(n*K)] += 1j*EPS
+    u = np.repeat(np.broadcast_to(ui,(K,)),n)
+    if np.ndim(U0):
+        U0 = np.repeat(U0,n)
+    fz,U = model.function(z,u,U0,coeffs)
+    fz = np.array(fz)
+    f = fz.real[:,::n]
+    J = (fz.imag/EPS).reshape(n,K,n).transpose(1,0,2)
+    return f,J
+
+
+def simulate(ui,h,params = PARAMETERS,x0 = None,U0 = 7.7175,ship = 'mariner',coeffs = None):
+    """
+    Integrates the state and its sensitivities to the parameters
+
+    Parameters
+    ----------
+    ui     : (N,) commanded rudder angle of every step (rad)
+    h      : sampling time (sec)
+    params : names of the parameters (coefficient table entries and/or 'ui')
+    x0     : initial state, default zeros
+
+    Returns
+    -------
+    X  : (N+1, n) states, X[k] at time k*h
+    dX : (N+1, n, P) sensitivities dX/dparams
+
+    """
+    model = models.get(ship)
+    c = model.coefficients if coeffs is None else coeffs
+    n = len(model.state)
+    P = len(params)
+    N = len(ui)
+
+    # one batch column per parameter, perturbed along its own direction only
+    table = dict(c)
+    step = 1j*EPS*np.eye(max(P,1))[:P]
+    for j,name in enumerate(params):
+        if name != 'ui':
+            table[name] = c[name]+step[j]
+    dui = np.array([1j*EPS if name == 'ui' else 0 for name in params])
+
+    x = np.zeros(n) if x0 is None else np.asarray(x0,dtype=float).ravel()
+    S = np.zeros((n,P))
+    X = np.empty((N+1,n))
+    dX = np.empty((N+1,n,P))
+    X[0],dX[0] = x,S
+    for k in range(N):
+        if P == 0:
+            f,U = model.function(x[:,None],ui[k],U0,c)
+            x = x+h*np.array(f)[:,0]
+        else:
+            f,U = model.function(x[:,None]+1j*EPS*S,ui[k]+dui,U0,table)
+            f = np.array(f)
+            x = x+h*f[:,0].real
+            S = S+h*f.imag/EPS
+        X[k+1],dX[k+1] = x,S
+    return X,dX
+
+
+def crossing(a,da,level,values,dvalues):
+    """
+    Value (and its sensitivity) linearly interpolated where a first reaches level
+
+    a, values   : (N,) series
+    da, dvalues : (N, P) their sensitivities
+    """
+    k = int(np.argmax(a >= level))
+    if a[k] < level or k == 0:
+        return np.nan,np.full(da.shape[1],np.nan)
+    w = (level-a[k-1])/(a[k]-a[k-1])
+    dw = (-da[k-1]*(a[k]-a[k-1])-(level-a[k-1])*(da[k]-da[k-1]))/(a[k]-a[k-1])**2
+    value = values[k-1]+w*(values[k]-values[k-1])
+    dvalue = dvalues[k-1]+dw*(values[k]-values[k-1])+w*(dvalues[k]-dvalues[k-1])
+    return value,dvalue
+
+
+def turning_metrics(X,dX,h,t_rudderexecute):
+    """
+    Advance, transfer (90 deg) and tactical diameter (180 deg) of a turning circle
+    and their sensitivities
+
+    Returns
+    -------
+    metrics : {name: (value, (P,) sensitivity)}
+
+    """
+    k0 = round(t_rudderexecute/h)
+    sign = np.sign(X[-1,5]) or 1.0
+    psi,dpsi = sign*X[:,5],sign*dX[:,5]
+    metrics = {}
+    for name,col,level in (('advance',3,np.pi/2),('transfer',4,np.pi/2),('tactical',4,np.pi)):
+        value,dvalue = crossing(psi,dpsi,level,X[:,col],dX[:,col])
+        value,dvalue = value-X[k0,col],dvalue-dX[k0,col]
+        s = np.sign(value)
+        metrics[name] = (s*value,s*dvalue)
+    return metrics
+
+
+def finite_differences(ui,h,params = PARAMETERS,rel_step = 1e-6,x0 = None,U0 = 7.7175,
+                       ship = 'mariner',coeffs = None):
+    """
+    Reference dX/dparams by one-sided finite differences (one full run per parameter)
+    """
+    model = models.get(ship)
+    c = model.coefficients if coeffs is None else coeffs
+    X,_ = simulate(ui,h,(),x0,U0,ship,c)
+    dX = np.empty(X.shape+(len(params),))
+    for j,name in enumerate(params):
+        table = dict(c)
+        if name == 'ui':
+            d = rel_step
+            Xj,_ = simulate(ui+d,h,(),x0,U0,ship,c)
+        else:
+            d = rel_step*max(abs(c[name]),1e-8)
+            table[name] = c[name]+d
+            Xj,_ = simulate(ui,h,(),x0,U0,ship,table)
+        dX[...,j] = (Xj-X)/d
+    return X,dX
+
+
+if __name__ == "__main__":
+    h = 0.1
+    t_rudderexecute = 100
+    N = round(700/h)
+    ui = np.where(np.arange(N)*h < t_rudderexecute,0.0,-35*np.pi/180)     #turning circle
+
+    t0 = timer.perf_counter()
+    X,dX = simulate(ui,h)
+    t_sens = timer.perf_counter()-t0
+
+    t0 = timer.perf_counter()
+    Xf,dXf = finite_differences(ui,h)
+    t_fd = timer.perf_counter()-t0
+
+    metrics = turning_metrics(X,dX,h,t_rudderexecute)
+    metrics_fd = turning_metrics(Xf,dXf,h,t_rudderexecute)
+    print("Sensitivity run : %.2f s    finite differences (%d runs) : %.2f s" % (t_sens,len(PARAMETERS)+1,t_fd))
+    for name in metrics:
+        value,d = metrics[name]
+        d_fd = metrics_fd[name][1]
+        err = np.abs(d-d_fd).max()/np.abs(d_fd).max()
+        print("%-9s %10.2f m   max relative deviation from finite differences : %.2e" % (name,value,err))
+    value,d = metrics['tactical']
+    for j in np.argsort(-np.abs(d))[:8]:
+        print("  d tactical / d %-5s : %12.4e   (fd %12.4e)" % (PARAMETERS[j],d[j],metrics_fd['tactical'][1][j]))
@@ -0,0 +1,279 @@
+"""
+Course stability of the Mariner model over a grid of operating points
+
+Instead of running spiral tests, spiral_curve() solves for the steady turns
+at a grid of prescribed yaw rates r' (the rudder angle holding each turn is
+unique even where the spiral curve loops), and equilibria() finds where that
+curve crosses every rudder angle of a (U0, rudder) grid and refines the
+crossings by Newton on u, v, r. Both are batched Newton iterations over the
+whole grid with the exact Jacobian of sensitivity.jacobian (complex step).
+Inside the loop of a course-unstable hull the three equilibria (two stable
+turns, the unstable straight course between them) are all found.
+
+analyze() linearizes the model about every equilibrium and returns with
+batched linear algebra (one np.linalg call over the whole grid)
+
+    eigenvalues : of the (u, v, r) subsystem, stable if all real parts < 0
+    index       : linear stability index C' = det(A_vr) (L/U)^2 of the
+                  sway-yaw subsystem, > 0 for a course-stable equilibrium
+    K, T1, T2, T3, T : Nomoto gain and time constants of r/delta,
+                  K (1+T3 s) / ((1+T1 s)(1+T2 s)), first order T = T1+T2-T3
+                  (a negative T1 marks the unstable straight course)
+
+delta is taken with the sign of the commanded rudder ui (positive ui ->
+positive r), as in nomoto.py, so K is positive.
+
+"""
+
+import time as timer
+import numpy as np
+import models
+import sensitivity
+
+R_GRID = np.linspace(-0.3,0.3,121)       #non-dimensional yaw rates r' = r L/U0 of the spiral curve
+STEP = {0: 0.5,1: 0.5,2: 0.005,6: 0.2}   #largest Newton steps of u, v (m/s), r (rad/s), delta (rad)
+
+
+def _solve(x,ui,speed,unknowns,tol,max_iter,ship,coeffs):
+    """
+    Batched Newton iteration on the surge, sway and yaw equations for the states `unknowns`
+
+    Returns
+    -------
+    x         : (7,K) states
+    converged : (K,) non-dimensional residual below tol
+    """
+    model = models.get(ship)
+    scale = np.array([1.0,1.0,model.L])[:,None]/speed**2            #non-dimensional forces
+    limit = np.array([STEP[j] for j in unknowns])[:,None]
+    active = np.ones(x.shape[1],dtype=bool)
+    for it in range(max_iter):
+        k = np.flatnonzero(active)
+        if len(k) == 0:
+            break
+        f,J = sensitivity.jacobian(x[:,k],ui[k],speed[k],ship,coeffs)
+        res = np.abs(f[:3]*scale[:,k]).max(axis=0)
+        active[k[res < tol]] = False
+        k,f,J = k[res >= tol],f[:,res >= tol],J[res >= tol]
+        dx = np.linalg.solve(J[:,:3][:,:,unknowns],-f[:3].T[:,:,None])[:,:,0].T
+        dx *= np.minimum(1,np.min(limit/np.maximum(np.abs(dx),1e-300),axis=0))
+        x[np.ix_(unknowns,k)] += dx
+    return x,~active
+
+
+def spiral_curve(U0,r_nd = R_GRID,tol = 1e-12,max_iter = 20,ship = 'mariner',coeffs = None):
+    """
+    Steady turns at prescribed yaw rates: the spiral curve, unique for every r'
+
+    Parameters
+    ----------
+    U0   : (M,) nominal speeds (m/s)
+    r_nd : (R,) non-dimensional yaw rates r' = r L/U0
+
+    Returns
+    -------
+    x         : (7,M,R) steady states, x[6] the rudder angle holding the turn (-ui)
+    converged : (M,R)
+    """
+    model = models.get(ship)
+    U0 = np.asarray(U0,dtype=float)
+    shape = (len(U0),len(r_nd))
+    speed = np.broadcast_to(U0[:,None],shape).ravel()
+    x = np.zeros((7,speed.size))
+    x[2] = np.broadcast_to(np.asarray(r_nd,dtype=float)[None,:],shape).ravel()*speed/model.L
+    x,converged = _solve(x,np.zeros(speed.size),speed,[0,1,6],tol,max_iter,ship,coeffs)
+    return x.reshape((7,)+shape),converged.reshape(shape)
+
+
+def equilibria(U0,rudder,branches = 3,r_nd = R_GRID,tol = 1e-12,max_iter = 40,ship = 'mariner',coeffs = None):
+    """
+    Steady states with the rudder held, for every (U0, rudder angle) of a grid
+
+    The equilibria are the crossings of the spiral curve with the rudder angle,
+    interpolated on the r' grid and refined by Newton on u, v, r. A course-unstable
+    hull has three crossings inside its loop, a stable one a single crossing.
+    Rudder angles beyond the ends of the curve start from its nearest point.
+
+    Parameters
+    ----------
+    U0       : (M,) nominal speeds (m/s)
+    rudder   : (A,) rudder angles (deg), sign of ui
+    branches : equilibria kept per grid point, in increasing r
+
+    Returns
+    -------
+    x     : (7,B,M,A) equilibrium states (positions and heading zero), B = branches
+    found : (B,M,A) the equilibrium exists (and converged)
+    """
+    U0 = np.asarray(U0,dtype=float)
+    rudder = np.radians(np.asarray(rudder,dtype=float))
+    curve,ok = spiral_curve(U0,r_nd,ship = ship,coeffs = coeffs)
+    M,R = ok.shape
+    A,B = len(rudder),branches
+
+    # crossings of the curve (ui = -delta as a function of r') with every rudder angle
+    s = -curve[6][:,None,:]-rudder[None,:,None]                          #(M,A,R)
+    cross = ((s[:,:,:-1] < 0) != (s[:,:,1:] < 0)) & ok[:,None,:-1] & ok[:,None,1:]
+    count = np.cumsum(cross,axis=2)
+    x = np.zeros((7,B,M,A))
+    found = np.zeros((B,M,A),dtype=bool)
+    m,a = np.meshgrid(np.arange(M),np.arange(A),indexing='ij')
+    for b in range(B):
+        has = count[:,:,-1] > b
+        k = np.argmax(count > b,axis=2)                                  #segment k..k+1
+        w = np.where(has,s[m,a,k]/np.where(has,s[m,a,k]-s[m,a,k+1],1),0)
+        x[:3,b] = curve[:3][:,m,k]+w*(curve[:3][:,m,k+1]-curve[:3][:,m,k])
+        found[b] = has
+    # beyond the ends of the curve (large rudder, r' no longer grows): start from the nearest point
+    none = (count[:,:,-1] == 0) & ok.any(axis=1)[:,None]
+    k = np.argmin(np.where(ok[:,None,:],np.abs(s),np.inf),axis=2)
+    x[:3,0] = np.where(none,curve[:3][:,m,k],x[:3,0])
+    found[0] |= none
+    x[6] = -rudder[None,None,:]
+
+    speed = np.broadcast_to(U0[None,:,None],(B,M,A)).ravel()
+    flat = x.reshape(7,-1)
+    idx = np.flatnonzero(found.ravel())
+    z,converged = _solve(flat[:,idx],-flat[6,idx],speed[idx],[0,1,2],tol,max_iter,ship,coeffs)
+    flat[:,idx] = z
+    found.ravel()[idx] = converged
+    return flat.reshape(7,B,M,A),found
+
+
+def analyze(U0,rudder,branches = 3,ship = 'mariner',coeffs = None):
+    """
+    Equilibria, eigenvalues, stability index and Nomoto constants over the grid U0 x rudder
+
+    Returns
+    -------
+    dict of (B,M,A) arrays : 'u','v','r' (equilibrium), 'r_nd' (r L/U), 'found',
+                             'stable', 'margin' (largest real part, 1/s), 'index', 'K','T1','T2','T3','T',
+                             and 'eigenvalues' (B,M,A,3); NaN where found is False
+    """
+    model = models.get(ship)
+    x,found = equilibria(U0,rudder,branches,ship = ship,coeffs = coeffs)
+    shape = found.shape
+    speed = np.broadcast_to(np.asarray(U0,dtype=float)[None,:,None],shape).ravel()
+    ui = -x[6].ravel()
+    f,J = sensitivity.jacobian(x.reshape(7,-1),ui,speed,ship,coeffs)
+
+    A = J[:,:3,:3]
+    eig = np.linalg.eigvals(A)
+    margin = eig.real.max(axis=1)
+
+    # sway-yaw subsystem and rudder input (sign of ui)
+    a11,a12,a21,a22 = A[:,1,1],A[:,1,2],A[:,2,1],A[:,2,2]
+    b1,b2 = -J[:,1,6],-J[:,2,6]
+    tr = a11+a22
+    det = a11*a22-a12*a21
+    num = a21*b1-a11*b2
+    root = np.sqrt((tr*tr-4*det).astype(complex))
+    T1 = ((-tr+root)/(2*det)).real
+    T2 = ((-tr-root)/(2*det)).real
+    T3 = b2/num
+    U = np.hypot(speed+x[0].ravel(),x[1].ravel())
+
+    out = {'u': x[0],'v': x[1],'r': x[2],'r_nd': x[2]*model.L/U.reshape(shape),
+           'found': found,
+           'eigenvalues': eig.reshape(shape+(3,)),
+           'stable': (margin < 0).reshape(shape),
+           'margin': margin.reshape(shape),
+           'index': (det*(model.L/U)**2).reshape(shape),
+           'K': (num/det).reshape(shape),
+           'T1': T1.reshape(shape),'T2': T2.reshape(shape),'T3': T3.reshape(shape),
+           'T': (T1+T2-T3).reshape(shape)}
+    for k,v in out.items():
+        if k != 'found':
+            mask = found[...,None] if v.ndim == 4 else found
+            out[k] = np.where(mask,v,np.nan)
+    return out
+
+
+def loop(result,rudder):
+    """
+    Rudder range (deg) of the unstable loop of the spiral curve, where three equilibria exist
+
+    Returns
+    -------
+    low, high : (M,) per speed, NaN for a course-stable hull
+    """
+    three = np.nansum(result['found'],axis=0) == 3
+    rudder = np.asarray(rudder,dtype=float)
+    low = np.where(three,rudder,np.inf).min(axis=1)
+    high = np.where(three,rudder,-np.inf).max(axis=1)
+    return np.where(three.any(axis=1),low,np.nan),np.where(three.any(axis=1),high,np.nan)
+
+
+if __name__ == "__main__":
+    U0 = np.linspace(4,10,25)
+    rudder = np.linspace(-35,35,141)
+    analyze(U0[:2],rudder[:2])                                     #warm-up
+    t0 = timer.perf_counter()
+    result = analyze(U0,rudder)
+    wall = timer.perf_counter()-t0
+    print("Stability map of %d operating points (%d speeds x %d rudder angles) in %.3f s, %d equilibria" %
+          (len(U0)*len(rudder),len(U0),len(rudder),wall,result['found'].sum()))
+
+    j = np.argmin(np.abs(U0-7.7175))
+    k0 = np.argmin(np.abs(rudder))
+    straight = int(np.argmin(np.abs(np.nan_to_num(result['r_nd'][:,j,k0],nan=np.inf))))
+    print("U0 = %.2f m/s, rudder 0 : straight course %s, margin %.4f 1/s, index C' = %.4f, "
+          "Nomoto K = %.4f 1/s, T1 = %.1f s, T2 = %.1f s, T3 = %.1f s" %
+          (U0[j],"stable" if result['stable'][straight,j,k0] else "unstable",result['margin'][straight,j,k0],
+           result['index'][straight,j,k0],result['K'][straight,j,k0],result['T1'][straight,j,k0],
+           result['T2'][straight,j,k0],result['T3'][straight,j,k0]))
+    low,high = loop(result,rudder)
+    if np.isnan(low).all():
+        print("No unstable loop of the spiral curve: course stable at every speed")
+    else:
+        print("Unstable loop of the spiral curve at U0 = %.2f m/s : rudder %.1f..%.1f deg" % (U0[j],low[j],high[j]))
+
+    # a course-unstable variant (weaker yaw damping): three equilibria inside the loop
+    import mariner
+    coeffs = dict(mariner.coefficients)
+    coeffs['Nr'] = coeffs['Nru'] = -100e-5
+    fine = np.linspace(-5,5,201)
+    t0 = timer.perf_counter()
+    unstable = analyze(U0,fine,coeffs = coeffs)
+    low,high = loop(unstable,fine)
+    k = np.flatnonzero(np.nansum(unstable['found'][:,j],axis=0) == 3)[0]
+    print("Nr = Nru = -100e-5 (%.3f s) : unstable loop at U0 = %.2f m/s for rudder %.2f..%.2f deg, at %.2f deg" %
+          (timer.perf_counter()-t0,U0[j],low[j],high[j],fine[k]))
+    for b in range(3):
+        print("  r' %+.4f  %-8s  T1 %8.1f s  max Re(eig) %+.5f 1/s" %
+              (unstable['r_nd'][b,j,k],"stable" if unstable['stable'][b,j,k] else "unstable",
+               unstable['T1'][b,j,k],unstable['margin'][b,j,k]))
+
+    # check against long simulations with the rudder held, from a straight course
+    f = models.get('mariner').function
+    test = np.array([-20,-10,-5,5,10,20],dtype=float)
+    x = np.zeros((7,len(test)))
+    x[6] = -np.radians(test)
+    h = 0.5
+    t0 = timer.perf_counter()
+    for i in range(round(3000/h)):
+        xdot,U = f(x,np.radians(test),U0[j])
+        x = x+h*np.array(xdot)
+    t_sim = timer.perf_counter()-t0
+    print("Steady yaw rate, equilibrium vs 3000 s simulation (%.1f s for %d runs) :" % (t_sim,len(test)))
+    for a,r_sim in zip(test,x[2]):
+        k = np.argmin(np.abs(rudder-a))
+        r_eq = result['r'][:,j,k]
+        r_eq = r_eq[np.nanargmin(np.abs(r_eq-r_sim))]
+        print("  rudder %+5.1f deg : %.6f rad/s  vs  %.6f rad/s" % (a,r_eq,r_sim))
+
+    # check against the spiral test driver (Spiral Test/spiral.py): yaw rate at the end of every rudder hold
+    from parareal import SPIRAL_TIMES,spiral_driver
+    t,u,v,r,x,y,psi,U,delta_c = spiral_driver().activate('mariner',np.zeros((7,1)),5*np.pi/180,5300,10,0.1)
+    t,r,delta_c = t[:-1],np.radians(r[:-1]),delta_c[:-1]
+    end = np.searchsorted(t,SPIRAL_TIMES,side='right')-1
+    levels = delta_c[end]
+    spiral = analyze(np.array([7.7175]),levels)
+    r_eq = spiral['r'][:,0,:]
+    r_eq = r_eq[np.nanargmin(np.abs(r_eq-r[end]),axis=0),np.arange(len(end))]
+    deviation = np.abs(r_eq-r[end])/np.abs(r_eq)
+    print("Steady yaw rate, equilibrium vs spiral test driver (U0 = 7.7175 m/s, %d rudder holds) : "
+          "max deviation %.2f %%" % (len(end),100*deviation.max()))
+    for k in np.flatnonzero(np.isin(np.round(levels),[5,10,20,35])):
+        print("  rudder %4.1f deg, held until %6.1f s : %.6f rad/s  vs  %.6f rad/s" %
+              (levels[k],t[end[k]],r_eq[k],r[end[k]]))
@@ -0,0 +1,270 @@
+"""
+System identification of the Mariner hydrodynamic derivatives from trajectories
+
+The X, Y and N expressions in mariner.activate are linear in the hydrodynamic
+derivatives, so the derivatives can be recovered by least squares once the
+finite differences du, dv, dr of a trajectory are mapped back to forces
+through the (known) mass matrix. Trajectories can be given as the xout matrix
+returned by the drivers, as .npy dumps of it, or as the CSV files written by
+simulate_data.py. Every source is streamed in chunks and reduced to its
+normal equations, so datasets larger than memory can be fitted.
+
+Usage:
+    coeffs, report = sysid.fit(["2000_sec_20_15_10_5.csv", traj], alpha = 1e-8)
+
+"""
+
+import itertools
+import time as timer
+import numpy as np
+import mariner
+from trajectory import Trajectory
+
+
+def exponents(name):
+    """
+    Powers of the non-dimensional (u, v, r, delta) in the monomial of a
+    hydrodynamic derivative, read from its name: 'Yvvr' -> (0,2,1,0), 'Y0u' -> (1,0,0,0)
+    """
+    body = name[1:]
+    return tuple(body.count(s) for s in "uvrd")
+
+
+def force_terms(names):
+    """ Hydrodynamic derivatives of a force expression (added mass terms excluded) """
+    return [k for k in names if not k.endswith("dot")]
+
+
+X_TERMS = force_terms(mariner.X_NAMES)
+Y_TERMS = force_terms(mariner.Y_NAMES)
+N_TERMS = force_terms(mariner.N_NAMES)
+
+
+def regressors(u,v,r,delta,names):
+    """
+    Builds the regressor matrix of a force expression
+
+    Parameters
+    ----------
+    u,v,r,delta : non-dimensional states, arrays of length n
+    names       : hydrodynamic derivative names, e.g. X_TERMS
+
+    Returns
+    -------
+    A : (n, len(names)) matrix with one monomial per column
+
+    """
+    powers = []
+    for s in (u,v,r,delta):
+        s2 = s*s
+        powers.append((np.ones_like(s),s,s2,s2*s))
+
+    A = np.empty((len(u),len(names)))
+    for j,name in enumerate(names):
+        e = exponents(name)
+        A[:,j] = powers[0][e[0]]*powers[1][e[1]]*powers[2][e[2]]*powers[3][e[3]]
+    return A
+
+
+def rudder_response(ui,h,delta0 = 0.0):
+    """
+    Reconstructs the actual rudder angle from the commanded one.
+
+    The drivers only record the commanded rudder (u_ship), the actual rudder is
+    the 7th state of mariner.activate and follows the saturated, rate limited
+    rudder dynamics. delta[k] is the rudder after the k-th Euler step.
+    """
+    d_max  = mariner.delta_max*np.pi/180
+    dd_max = mariner.Ddelta_max*np.pi/180*h
+    delta = np.empty(len(ui))
+    d = delta0
+    for k,c in enumerate((-np.asarray(ui,dtype=float)).tolist()):
+        c = min(max(c,-d_max),d_max)
+        d += min(max(h*(c-d),-dd_max),dd_max)
+        delta[k] = d
+    return delta
+
+
+def read_chunks(source,chunk_size = 1<<18,U0 = 7.7175):
+    """
+    Streams a trajectory as chunks of rows [t, u, v, r, U, ui] with u perturbed
+    about U0, r in rad/s and the commanded rudder ui in rad.
+
+    Parameters
+    ----------
+    source : Trajectory returned by the drivers, its (N x 9) xout matrix or the path of
+             a .npy dump of it, or the path of a CSV written by simulate_data.py
+             (columns t, u+U0, v, r (deg/s), psi (deg), U, delta_c (deg))
+    """
+    if isinstance(source,str) and source.endswith(".csv"):
+        with open(source) as f:
+            while True:
+                lines = list(itertools.islice(f,chunk_size))
+                if not lines:
+                    return
+                yield _from_csv(np.loadtxt(lines,delimiter=",",ndmin=2),U0)
+        return
+
+    if isinstance(source,str):
+        source = np.load(source,mmap_mode="r")
+    if isinstance(source,Trajectory):
+        source = source.data
+
+    source = np.asarray(source) if not isinstance(source,np.memmap) else source
+    for i in range(0,len(source),chunk_size):
+        rows = np.asarray(source[i:i+chunk_size],dtype=float)
+        if rows.shape[1] == 9:
+            yield rows[:,[0,1,2,3,7,8]]
+        else:
+            yield _from_csv(rows,U0)
+
+
+def _from_csv(rows,U0):
+    d2r = np.pi/180
+    return np.column_stack((rows[:,0],rows[:,1]-U0,rows[:,2],rows[:,3]*d2r,rows[:,5],rows[:,6]*d2r))
+
+
+def samples(source,chunk_size = 1<<18,U0 = 7.7175,coeffs = None):
+    """
+    Yields the identification samples of a trajectory chunk by chunk.
+
+    Returns
+    -------
+    u,v,r,delta : non-dimensional states the derivative was evaluated at
+    X,Y,N       : non-dimensional forces recovered from du, dv, dr
+
+    """
+    c = mariner.coefficients if coeffs is None else coeffs
+    L = mariner.L
+    m11 = c['m']-c['Xudot']
+    m22 = c['m']-c['Yvdot']
+    m23 = c['m']*c['xG']-c['Yrdot']
+    m32 = c['m']*c['xG']-c['Nvdot']
+    m33 = c['Iz']-c['Nrdot']
+
+    prev, delta0, h = None, 0.0, None
+    for rows in read_chunks(source,chunk_size,U0):
+        # the recorders keep exactly the N sample rows; only old dumps of a preallocated xout
+        # (and the CSV of Spiral Test/simulate_data.py) end with an unfilled row (U = 0)
+        rows = rows[rows[:,4] > 0]
+        if prev is not None:
+            rows = np.vstack((prev,rows))
+        if len(rows) < 2:
+            prev = rows
+            continue
+        if h is None:
+            h = rows[1,0]-rows[0,0]
+            delta = rudder_response(rows[:,5],h,delta0)
+        else:
+            # the first row was already reconstructed with the previous chunk
+            delta = np.concatenate(([delta0],rudder_response(rows[1:,5],h,delta0)))
+
+        # row k holds the state after step k, row k+1 = row k + h*xdot(row k)
+        du,dv,dr = (np.diff(rows[:,1:4],axis=0)/h).T
+        x0,x1,x2,U = rows[:-1,1],rows[:-1,2],rows[:-1,3],rows[:-1,4]
+
+        u = x0/U
+        v = x1/U
+        r = x2*L/U
+        a = dv*L/(U**2)
+        b = dr*(L**2)/(U**2)
+
+        yield u,v,r,delta[:-1],du*L*m11/(U**2),m22*a+m23*b,m32*a+m33*b
+
+        prev, delta0 = rows[-1:],delta[-1]
+
+
+def accumulate(sources,chunk_size = 1<<18,U0 = 7.7175,coeffs = None):
+    """
+    Reduces one or many trajectories to the normal equations of the X, Y and N fits
+
+    Returns
+    -------
+    acc : {'X': [AtA, Atb, btb, n], 'Y': [...], 'N': [...]}
+
+    """
+    if isinstance(sources,(str,np.ndarray,Trajectory)):
+        sources = [sources]
+
+    terms = {'X': X_TERMS, 'Y': Y_TERMS, 'N': N_TERMS}
+    acc = {k: [np.zeros((len(t),len(t))),np.zeros(len(t)),0.0,0] for k,t in terms.items()}
+    for source in sources:
+        for u,v,r,delta,X,Y,N in samples(source,chunk_size,U0,coeffs):
+            for k,b in (('X',X),('Y',Y),('N',N)):
+                A = regressors(u,v,r,delta,terms[k])
+                acc[k][0] += A.T @ A
+                acc[k][1] += A.T @ b
+                acc[k][2] += b @ b
+                acc[k][3] += len(b)
+    return acc
+
+
+def solve(acc,alpha = 1e-8):
+    """
+    Solves the regularized normal equations (AtA + alpha*diag(AtA)) theta = Atb
+
+    Returns
+    -------
+    coeffs : fitted hydrodynamic derivatives by name
+    rms    : residual rms of the X, Y and N fits
+
+    """
+    terms = {'X': X_TERMS, 'Y': Y_TERMS, 'N': N_TERMS}
+    coeffs, rms = {}, {}
+    for k,(AtA,Atb,btb,n) in acc.items():
+        # columns that never get excited (e.g. no rudder in the data) are left at zero
+        d = np.diag(AtA).copy()
+        d[d == 0] = 1.0
+        theta = np.linalg.solve(AtA+alpha*np.diag(d),Atb)
+        coeffs.update(zip(terms[k],theta))
+        sse = btb-2*theta @ Atb+theta @ AtA @ theta
+        rms[k] = np.sqrt(max(sse,0.0)/max(n,1))
+    return coeffs,rms
+
+
+def fit(sources,alpha = 1e-8,chunk_size = 1<<18,U0 = 7.7175,coeffs = None):
+    """
+    Fits the hydrodynamic derivatives of mariner.activate to trajectories
+
+    Parameters
+    ----------
+    sources    : trajectory or list of trajectories (Trajectory, xout matrices, .npy or .csv paths)
+    alpha      : relative ridge regularization
+    chunk_size : rows held in memory at a time
+    U0         : nominal speed the trajectories were simulated at
+    coeffs     : table holding the (known) mass and added mass terms, default mariner.coefficients
+
+    Returns
+    -------
+    fitted : coefficient table, a copy of coeffs with the force derivatives replaced
+    report : {'samples', 'rms', 'seconds'}
+
+    """
+    t0 = timer.perf_counter()
+    acc = accumulate(sources,chunk_size,U0,coeffs)
+    fitted,rms = solve(acc,alpha)
+    table = dict(mariner.coefficients if coeffs is None else coeffs)
+    table.update(fitted)
+    report = {'samples': acc['X'][3], 'rms': rms, 'seconds': timer.perf_counter()-t0}
+    return table,report
+
+
+if __name__ == "__main__":
+    import os
+    import tempfile
+    import zig_zag
+
+    xt = np.zeros((7,1))
+    traj = zig_zag.activate('mariner',xt,0,2000,10,0.1,[20,20])
+
+    table,report = fit(traj)
+    print("Samples : ",report['samples'],"   time : %.3f s" % report['seconds'])
+    print("%-6s %14s %14s" % ("name","mariner","fitted"))
+    for name in X_TERMS+Y_TERMS+N_TERMS:
+        print("%-6s %14.6e %14.6e" % (name,mariner.coefficients[name],table[name]))
+
+    # throughput on a few million samples streamed from disk
+    path = os.path.join(tempfile.mkdtemp(),"sweep.npy")
+    np.save(path,np.tile(traj.data,(100,1)))
+    table,report = fit(path)
+    print("Samples : ",report['samples'],"   time : %.3f s" % report['seconds'])
@@ -0,0 +1,243 @@
+"""
+Live progress telemetry through shared memory
+
+A Telemetry block is a small float64 array in multiprocessing shared memory:
+a header (progress counters) and a fixed-size ring buffer of the most recent
+sample rows with their wall-clock time. The simulation loop only writes into
+it (a few scalar stores every `every` steps), any thread or process attaches
+by name and reads progress, steps per second, ETA and the latest states.
+
+In the drivers it is used as a recorder wrapping the real one, so the loop
+is unchanged:
+
+    tm = telemetry.Telemetry('spiral_5300')
+    traj = zig_zag.activate('mariner',x,ui,5300,10,0.1,recorder = tm.recorder())
+
+and from another shell
+
+    python telemetry.py spiral_5300
+
+A loop that has no sample rows (e.g. a sweep over runs) calls tm.start(N),
+tm.step(i) and tm.close() directly.
+
+Reads are consistent: the writer increments a sequence counter before and
+after every write (odd while writing) and the reader retries torn copies.
+
+"""
+
+import sys
+import time as timer
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+import recorders
+
+SEQ, TOTAL, STEP, T_START, T_NOW, CAPACITY, WIDTH, DONE = range(8)
+HEADER = 8
+
+_created = set()          #names of the blocks created by this process
+
+
+class Telemetry:
+
+    def __init__(self,name = None,capacity = 256,width = len(recorders.COLUMNS),every = 10):
+        """
+        Parameters
+        ----------
+        name     : shared memory name, the monitor attaches with it (default: generated)
+        capacity : number of rows kept in the ring buffer
+        width    : length of a sample row
+        every    : steps between two writes (the counters and the ring are updated every `every` steps)
+        """
+        self.every = int(every)
+        self.capacity = capacity
+        self.width = width
+        size = (HEADER+capacity*(width+2))*8
+        self.shm = shared_memory.SharedMemory(name = name,create = True,size = size)
+        self.name = self.shm.name
+        _created.add(self.name)
+        self.data = np.ndarray((size//8,),dtype=np.float64,buffer=self.shm.buf)
+        self.data[:] = 0
+        self.data[CAPACITY],self.data[WIDTH] = capacity,width
+        self.ring = self.data[HEADER:].reshape(capacity,width+2)
+        self.count = 0
+
+    def start(self,N):
+        """ Starts a run of N samples: resets the counters and empties the ring """
+        d = self.data
+        d[SEQ] += 1
+        d[TOTAL],d[STEP],d[DONE] = N,0,0
+        self.ring[:] = 0          #step 0 marks an empty slot for the readers
+        d[T_START] = d[T_NOW] = timer.time()
+        d[SEQ] += 1
+        self.count = 0
+
+    def step(self,i,row = None):
+        """ Reports that sample i is done (cheap unless i is a multiple of `every`) """
+        if i % self.every:
+            return
+        d = self.data
+        now = timer.time()
+        d[SEQ] += 1
+        d[STEP],d[T_NOW] = i+1,now
+        slot = self.ring[self.count % self.capacity]
+        slot[0],slot[1] = now,i+1
+        if row is not None:
+            slot[2:] = row
+        self.count += 1
+        d[SEQ] += 1
+
+    def finish(self):
+        d = self.data
+        d[SEQ] += 1
+        d[STEP],d[T_NOW],d[DONE] = d[TOTAL],timer.time(),1
+        d[SEQ] += 1
+
+    def recorder(self,inner = None):
+        """ Recorder (see recorders.py) reporting to this block and forwarding to `inner` """
+        return TelemetryRecorder(self,recorders.FullRecorder() if inner is None else inner)
+
+    def close(self,unlink = True):
+        self.finish()
+        self.data = self.ring = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+            _created.discard(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+
+class TelemetryRecorder:
+    """ Forwards to a recorder and reports every sample row to a Telemetry block """
+
+    def __init__(self,telemetry,inner):
+        self.telemetry = telemetry
+        self.inner = inner
+
+    def start(self,N,dtype = np.float64):
+        self.telemetry.start(N)
+        self.inner.start(N,dtype)
+
+    def record(self,i,row):
+        self.inner.record(i,row)
+        self.telemetry.step(i,row)
+
+    def result(self):
+        self.telemetry.finish()
+        return self.inner.result()
+
+
+class Reader:
+    """ Read-only view of a Telemetry block, from any thread or process """
+
+    def __init__(self,name):
+        self.shm = shared_memory.SharedMemory(name = name)
+        # the creator owns the block: do not let this process' tracker unlink it at exit
+        if name not in _created:
+            resource_tracker.unregister(self.shm._name,'shared_memory')
+        self.data = np.ndarray((self.shm.size//8,),dtype=np.float64,buffer=self.shm.buf)
+
+    def snapshot(self,retries = 100):
+        """
+        Consistent copy of the block: (header, ring rows ordered oldest to newest), or None
+        if the writer was busy in every one of the retries
+        """
+        for k in range(retries):
+            seq = self.data[SEQ]
+            copy = self.data.copy()
+            if seq % 2 == 0 and self.data[SEQ] == seq:
+                break
+            timer.sleep(1e-4)
+        else:
+            return None
+        capacity,width = int(copy[CAPACITY]),int(copy[WIDTH])
+        ring = copy[HEADER:HEADER+capacity*(width+2)].reshape(capacity,width+2)
+        ring = ring[ring[:,1] > 0]
+        return copy[:HEADER],ring[np.argsort(ring[:,1])]
+
+    def status(self):
+        """
+        Returns
+        -------
+        dict with 'step', 'total', 'progress' (0..1), 'steps_per_second', 'eta' (sec),
+        'elapsed' (sec), 'done' and 'last' (latest sample row or None), or None if no
+        consistent snapshot could be read
+        """
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        header,ring = snapshot
+        step,total = header[STEP],header[TOTAL]
+        elapsed = header[T_NOW]-header[T_START]
+        # rate over the ring window (recent throughput), overall rate before it fills
+        if len(ring) > 1 and ring[-1,0] > ring[0,0]:
+            rate = (ring[-1,1]-ring[0,1])/(ring[-1,0]-ring[0,0])
+        else:
+            rate = step/elapsed if elapsed > 0 else 0.0
+        return {'step': int(step), 'total': int(total), 'progress': step/total if total else 0.0,
+                'steps_per_second': rate, 'eta': (total-step)/rate if rate > 0 else np.inf,
+                'elapsed': elapsed, 'done': bool(header[DONE]),
+                'last': ring[-1,2:] if len(ring) else None}
+
+    def close(self):
+        self.data = None
+        self.shm.close()
+
+
+def monitor(name,interval = 0.5,stream = sys.stdout):
+    """ Console monitor: attaches to a running job and prints its progress until it is done """
+    reader = Reader(name)
+    try:
+        while True:
+            s = reader.status()
+            if s is None:
+                timer.sleep(interval)
+                continue
+            bar = int(30*s['progress'])
+            line = "\r[%s%s] %5.1f%%  %8d/%d steps  %9.0f steps/s  ETA %6.1f s" % (
+                '#'*bar,'.'*(30-bar),100*s['progress'],s['step'],s['total'],s['steps_per_second'],
+                0.0 if s['done'] else s['eta'])
+            last = s['last']
+            if last is not None and len(last) == len(recorders.COLUMNS):
+                line += "  t %7.1f s  psi %7.2f deg  U %5.2f m/s" % (last[0],last[6]*180/np.pi,last[7])
+            stream.write(line)
+            stream.flush()
+            if s['done']:
+                stream.write("\n")
+                break
+            timer.sleep(interval)
+    finally:
+        reader.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        monitor(sys.argv[1])
+    else:
+        # demo: a long zig-zag in a thread, monitored from the main thread, and the loop overhead
+        import threading
+        import zig_zag
+        x = np.zeros((7,1))
+        T, h = 2000, 0.1
+
+        zig_zag.activate('mariner',x,0,50,10,h)              #warm-up
+        t0 = timer.perf_counter()
+        zig_zag.activate('mariner',x,0,T,10,h)
+        plain = timer.perf_counter()-t0
+
+        with Telemetry('mariner_telemetry') as tm:
+            elapsed = []
+            def job():
+                t0 = timer.perf_counter()
+                zig_zag.activate('mariner',x,0,T,10,h,recorder = tm.recorder())
+                elapsed.append(timer.perf_counter()-t0)
+            worker = threading.Thread(target = job)
+            worker.start()
+            monitor(tm.name,interval = 0.2)
+            worker.join()
+        print("Loop time without telemetry %.2f s, with telemetry %.2f s (monitor polling in the same process)" %
+              (plain,elapsed[0]))
@@ -0,0 +1,142 @@
+"""
+Multithreaded chunked backend for very large batched steps
+
+For millions of ships a single model call over the whole (7,K) state array
+streams every temporary through main memory and runs on one core. Stepper
+splits the columns into chunks small enough for the temporaries of the model
+to stay in cache and hands them to a thread pool: NumPy releases the GIL in
+its array loops, so the chunks run in parallel. Each chunk writes its Euler
+step x + h*xdot straight into a preallocated output buffer (no (7,K) xdot
+array is built), and step() swaps the two state buffers.
+
+    stepper = threaded.Stepper(K,threads = 8)          # chunk size auto-tuned
+    x = stepper.x                                      # (7,K) state, fill it in place
+    for i in range(N):
+        x = stepper.step(ui,h)
+
+"""
+
+import os
+import time as timer
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import models
+
+
+class Stepper:
+
+    def __init__(self,K,threads = None,chunk = None,U0 = 7.7175,ship = 'mariner',coeffs = None,
+                 dtype = np.float64):
+        """
+        Parameters
+        ----------
+        K       : number of ships (columns of the state)
+        threads : thread pool size, default os.cpu_count()
+        chunk   : columns per task, auto-tuned when None
+        """
+        model = models.get(ship)
+        self.f = model.function
+        self.coeffs = coeffs
+        self.U0 = U0
+        self.K = K
+        self.n = len(model.state)
+        self.threads = threads or os.cpu_count()
+        self.pool = ThreadPoolExecutor(self.threads)
+        self.x = np.zeros((self.n,K),dtype=dtype)
+        self.out = np.empty_like(self.x)
+        self.chunk = chunk or self.tune()
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*exc):
+        self.close()
+
+    def _step(self,a,b,ui,h):
+        x = self.x[:,a:b]
+        u = ui[a:b] if np.ndim(ui) else ui
+        xdot,U = self.f(x,u,self.U0,self.coeffs)
+        out = self.out[:,a:b]
+        for j in range(self.n):
+            np.multiply(xdot[j],h,out=out[j])
+            out[j] += x[j]
+
+    def step(self,ui,h,chunk = None):
+        """ One Euler step of all ships, returns the new (7,K) state (a preallocated buffer) """
+        chunk = chunk or self.chunk
+        if self.threads == 1:
+            for a in range(0,self.K,chunk):
+                self._step(a,min(a+chunk,self.K),ui,h)
+        else:
+            tasks = [self.pool.submit(self._step,a,min(a+chunk,self.K),ui,h) for a in range(0,self.K,chunk)]
+            for t in tasks:
+                t.result()
+        self.x,self.out = self.out,self.x
+        return self.x
+
+    def tune(self,sizes = None,span = 1 << 18,repeat = 3):
+        """
+        Chunk size with the lowest time per column among `sizes` (powers of two by default),
+        timed on the first `span` columns in this thread (the cache behaviour of one core)
+        """
+        span = min(span,self.K)
+        if sizes is None:
+            sizes = [1 << p for p in range(10,18)]
+        sizes = [s for s in sizes if s <= span] or [span]
+        ui = np.full(span,0.1)
+        best,best_time = sizes[0],np.inf
+        for s in sizes:
+            elapsed = np.inf
+            for r in range(repeat):
+                t0 = timer.perf_counter()
+                for a in range(0,span,s):
+                    self._step(a,min(a+s,span),ui,0.1)
+                elapsed = min(elapsed,timer.perf_counter()-t0)
+            if elapsed < best_time:
+                best,best_time = s,elapsed
+        return best
+
+
+def benchmark(K = 1000000,max_threads = None,steps = 10,h = 0.1):
+    """
+    Step time of the single whole-array call and of the chunked backend on 1..max_threads threads
+
+    Returns
+    -------
+    single  : seconds per step of the single call
+    results : {threads: (chunk, seconds per step)}
+    """
+    f = models.get('mariner').function
+    x = np.zeros((7,K))
+    x[0] = 0.1
+    ui = np.full(K,0.1)
+    f(x,ui)
+    t0 = timer.perf_counter()
+    for i in range(steps):
+        xdot,U = f(x,ui)
+        x = x+h*np.array(xdot)
+    single = (timer.perf_counter()-t0)/steps
+
+    results = {}
+    for threads in range(1,(max_threads or os.cpu_count())+1):
+        with Stepper(K,threads) as stepper:
+            stepper.x[0] = 0.1
+            t0 = timer.perf_counter()
+            for i in range(steps):
+                stepper.step(ui,h)
+            results[threads] = (stepper.chunk,(timer.perf_counter()-t0)/steps)
+            if threads == 1:
+                assert np.allclose(stepper.x,x)
+    return single,results
+
+
+if __name__ == "__main__":
+    for K in (100000,1000000):
+        single,results = benchmark(K)
+        print("K = %d : single call %.1f ms/step" % (K,single*1e3))
+        for threads,(chunk,seconds) in results.items():
+            print("  %2d thread(s), chunk %6d : %7.1f ms/step   speedup %.2fx" %
+                  (threads,chunk,seconds*1e3,single/seconds))
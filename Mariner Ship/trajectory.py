@@ -0,0 +1,109 @@
+"""
+Trajectory result object of the drivers
+
+A Trajectory wraps the recorded (n x 9) buffer
+
+    [time, u, v, r, x, y, psi, U, ui]
+
+without copying it. The columns are exposed as views in the units of the
+model (m/s, rad, rad/s), the usual plotting units are computed on first use
+and cached, slicing by index or time returns another view, and the buffer
+can be written to .npy or to the CSV layout of simulate_data.py directly.
+
+Usage:
+    traj = zig_zag.activate('mariner',xt,ui,2000,10,0.1)
+    plt.plot(traj.t,traj.psi_deg)
+    traj.between(500,1000).save("500_1000.csv")
+
+"""
+
+from functools import cached_property
+import numpy as np
+
+
+class Trajectory:
+
+    def __init__(self,data,U0 = 7.7175):
+        """
+        Parameters
+        ----------
+        data : (n, 9) recorded buffer, not copied
+        U0   : nominal speed the perturbed surge u is taken about (m/s)
+        """
+        self.data = data
+        self.U0 = U0
+
+    @classmethod
+    def load(cls,path,U0 = 7.7175):
+        """ Memory-maps a trajectory written with save(path) to .npy """
+        return cls(np.load(path,mmap_mode='r'),U0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self,index):
+        """ traj[a:b] is the trajectory of samples a..b-1 (a view) """
+        if not isinstance(index,slice):
+            raise TypeError("Trajectory indices must be slices")
+        return Trajectory(self.data[index],self.U0)
+
+    def between(self,t0,t1):
+        """ Samples with t0 <= time < t1 (a view, time is increasing) """
+        i0,i1 = np.searchsorted(self.t,[t0,t1])
+        return self[i0:i1]
+
+    def __repr__(self):
+        if len(self) == 0:
+            return "Trajectory(0 samples)"
+        return "Trajectory(%d samples, t = %g..%g s)" % (len(self),self.t[0],self.t[-1])
+
+    # Columns in the units of the model (views of the buffer)
+    t   = property(lambda self: self.data[:,0])
+    u   = property(lambda self: self.data[:,1])
+    v   = property(lambda self: self.data[:,2])
+    r   = property(lambda self: self.data[:,3])
+    x   = property(lambda self: self.data[:,4])
+    y   = property(lambda self: self.data[:,5])
+    psi = property(lambda self: self.data[:,6])
+    U   = property(lambda self: self.data[:,7])
+    ui  = property(lambda self: self.data[:,8])
+
+    # Derived columns, computed once on first access
+    @cached_property
+    def u_abs(self):
+        """ Absolute surge speed U0+u (m/s) """
+        return self.U0+self.u
+
+    @cached_property
+    def r_deg(self):
+        """ Yaw rate (deg/s) """
+        return self.r*(180/np.pi)
+
+    @cached_property
+    def psi_deg(self):
+        """ Yaw angle (deg) """
+        return self.psi*(180/np.pi)
+
+    @cached_property
+    def delta_deg(self):
+        """ Commanded rudder angle (deg) """
+        return self.ui*(180/np.pi)
+
+    def save(self,path,chunk = 1<<16):
+        """
+        Writes the trajectory to disk
+
+        .npy : the raw (n x 9) buffer, loadable with Trajectory.load
+        .csv : the layout of simulate_data.py, columns t, u+U0, v, r (deg/s), psi (deg), U, delta (deg)
+        """
+        if path.endswith(".npy"):
+            np.save(path,self.data)
+            return
+        d2r = 180/np.pi
+        scale = np.array([1,1,1,d2r,d2r,1,d2r])
+        offset = np.array([0,self.U0,0,0,0,0,0])
+        with open(path,"w") as f:
+            for i in range(0,len(self),chunk):
+                rows = self.data[i:i+chunk][:,[0,1,2,3,6,7,8]]*scale+offset
+                np.savetxt(f,rows,delimiter=",")
+
@@ -0,0 +1,233 @@
+"""
+Live incremental trajectory viewer
+
+LiveViewer draws the xy track and the psi/delta and U time panels of one or
+several ships while the simulation runs. Samples go into fixed-size rolling
+buffers and every frame only redraws the line artists over a cached
+background (blitting), so the cost of a frame does not grow with the length
+of the run. The axes limits grow (xy, psi/delta and U) or slide (time) by
+steps, the only full redraws. When the time buffers fill up before they span
+the time window, their sampling is halved (like the track), so any step
+size h shows the whole window.
+
+For the drivers it is a recorder wrapping the real one:
+
+    view = viewer.LiveViewer()
+    traj = zig_zag.activate('mariner',x,ui,2000,10,0.1,recorder = view.recorder())
+
+and batched loops push one row per ship:
+
+    view = viewer.LiveViewer(ships = R)
+    for i in range(N):
+        ...
+        view.push(rows)              # (R, 9) rows [time,u,v,r,x,y,psi,U,ui]
+
+Frames are drawn at most `fps` times per second of wall clock, so the viewer
+keeps up with faster-than-real-time runs by skipping frames, not samples.
+
+"""
+
+import time as timer
+import numpy as np
+import matplotlib.pyplot as plt
+import recorders
+
+
+class LiveViewer:
+
+    def __init__(self,ships = 1,capacity = 4000,window = 600.0,fps = 20.0,track = 20000):
+        """
+        Parameters
+        ----------
+        ships    : number of ships drawn
+        capacity : samples kept in the rolling buffers of the time panels (decimated by 2 while
+                   full and spanning less than the window)
+        window   : time span of the time panels (sec)
+        fps      : maximum frame rate
+        track    : samples kept of the xy track (decimated by 2 when full)
+        """
+        self.ships = ships
+        self.capacity = capacity
+        self.window = window
+        self.period = 1/fps
+        self.buffer = np.full((ships,capacity,len(recorders.COLUMNS)),np.nan)
+        self.count = 0
+        self.pushed = 0
+        self.sample_step = 1
+        self.track = np.full((ships,track,2),np.nan)
+        self.track_count = 0
+        self.track_step = 1
+        self.last_frame = -np.inf
+        self.frames = 0
+        self.frame_time = 0.0
+
+        plt.ion()
+        self.fig = plt.figure(figsize=(14,8))
+        self.ax_xy = self.fig.add_subplot(1,2,1)
+        self.ax_psi = self.fig.add_subplot(2,2,2)
+        self.ax_U = self.fig.add_subplot(2,2,4)
+        self.ax_xy.set_xlabel("X Position")
+        self.ax_xy.set_ylabel("Y Position")
+        self.ax_xy.set_title("Ship track")
+        self.ax_psi.set_title("Yaw angle ψ & rudder angle $ \\delta $ (deg)")
+        self.ax_U.set_title("Total speed U (m/s)")
+        self.ax_U.set_xlabel("Time in seconds")
+        for ax in (self.ax_xy,self.ax_psi,self.ax_U):
+            ax.grid()
+        self.ax_xy.set_aspect('equal',adjustable='box')
+        self.ax_xy.set_xlim(-1000,1000)
+        self.ax_xy.set_ylim(-1000,1000)
+        self.ax_psi.set_xlim(0,window)
+        self.ax_psi.set_ylim(-40,40)
+        self.ax_U.set_xlim(0,window)
+        self.ax_U.set_ylim(0,10)
+
+        colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+        self.lines = []
+        for k in range(ships):
+            c = colors[k % len(colors)]
+            self.lines.append((self.ax_xy.plot([],[],color=c,animated=True)[0],
+                               self.ax_psi.plot([],[],color=c,animated=True)[0],
+                               self.ax_psi.plot([],[],color=c,ls='--',animated=True)[0],
+                               self.ax_U.plot([],[],color=c,animated=True)[0]))
+        self.fig.canvas.mpl_connect('draw_event',self._on_draw)
+        self.background = None
+        self.fig.canvas.draw()
+        plt.show(block=False)
+
+    def _on_draw(self,event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def push(self,rows):
+        """ Adds one sample per ship, rows : (ships, 9) or (9,) for one ship """
+        rows = np.asarray(rows,dtype=float).reshape(self.ships,-1)
+        if self.pushed % self.sample_step == 0:
+            k = self.count % self.capacity
+            if self.count >= self.capacity and np.nanmax(self.buffer[:,k-1,0]-self.buffer[:,k,0]) < self.window:
+                # buffers full before spanning the window: keep every other sample, halve the sampling
+                ordered = np.concatenate((self.buffer[:,k:],self.buffer[:,:k]),axis=1)
+                half = ordered[:,1::2].copy()
+                self.buffer[:] = np.nan
+                self.buffer[:,:half.shape[1]] = half
+                self.count = half.shape[1]
+                self.sample_step *= 2
+            if self.pushed % self.sample_step == 0:
+                self.buffer[:,self.count % self.capacity] = rows
+                self.count += 1
+        self.pushed += 1
+        if self.pushed % self.track_step == 0:
+            if self.track_count == self.track.shape[1]:
+                # track buffer full: keep every other point, halve the sampling
+                half = self.track[:,::2].copy()
+                self.track[:] = np.nan
+                self.track[:,:half.shape[1]] = half
+                self.track_count = half.shape[1]
+                self.track_step *= 2
+            self.track[:,self.track_count] = rows[:,[4,5]]
+            self.track_count += 1
+        now = timer.perf_counter()
+        if now-self.last_frame >= self.period:
+            self.last_frame = now
+            self.draw()
+
+    @staticmethod
+    def _grow(ax,lo,hi):
+        """ Moves the y limits of ax that [lo, hi] crosses to half their span beyond the data """
+        y0,y1 = ax.get_ylim()
+        if not (lo < y0 or hi > y1):
+            return False
+        span = y1-y0
+        ax.set_ylim(lo-span/2 if lo < y0 else y0,hi+span/2 if hi > y1 else y1)
+        return True
+
+    def _rescale(self,ordered):
+        """ Grows/slides the axes limits to the buffered samples, returns True if a full redraw is due """
+        latest = ordered[:,-1]
+        t,xy = np.nanmax(latest[:,0]),latest[:,[4,5]]
+        angles = ordered[:,:,[6,8]]*180/np.pi
+        redraw = self._grow(self.ax_psi,np.nanmin(angles),np.nanmax(angles))
+        redraw |= self._grow(self.ax_U,np.nanmin(ordered[:,:,7]),np.nanmax(ordered[:,:,7]))
+        t0,t1 = self.ax_psi.get_xlim()
+        if t > t1:
+            t0 = t-self.window/2
+            for ax in (self.ax_psi,self.ax_U):
+                ax.set_xlim(t0,t0+self.window)
+            redraw = True
+        (x0,x1),(y0,y1) = self.ax_xy.get_xlim(),self.ax_xy.get_ylim()
+        lo,hi = np.nanmin(xy,axis=0),np.nanmax(xy,axis=0)
+        if lo[0] < x0 or hi[0] > x1 or lo[1] < y0 or hi[1] > y1:
+            span = 2*max(x1-x0,y1-y0)
+            cx,cy = (lo+hi)/2
+            self.ax_xy.set_xlim(cx-span/2,cx+span/2)
+            self.ax_xy.set_ylim(cy-span/2,cy+span/2)
+            redraw = True
+        return redraw
+
+    def draw(self):
+        """ Draws a frame: blits the line artists over the cached background """
+        t0 = timer.perf_counter()
+        k = self.count % self.capacity
+        ordered = np.concatenate((self.buffer[:,k:],self.buffer[:,:k]),axis=1)
+        if self._rescale(ordered) or self.background is None:
+            self.fig.canvas.draw()
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for s,(xy,psi,delta,U) in enumerate(self.lines):
+            track = self.track[s,:self.track_count]
+            xy.set_data(track[:,0],track[:,1])
+            t = ordered[s,:,0]
+            psi.set_data(t,ordered[s,:,6]*180/np.pi)
+            delta.set_data(t,ordered[s,:,8]*180/np.pi)
+            U.set_data(t,ordered[s,:,7])
+            for line in (xy,psi,delta,U):
+                line.axes.draw_artist(line)
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+        self.frames += 1
+        self.frame_time += timer.perf_counter()-t0
+
+    def recorder(self,inner = None):
+        """ Recorder (see recorders.py) drawing the samples and forwarding them to `inner` """
+        return ViewerRecorder(self,recorders.FullRecorder() if inner is None else inner)
+
+
+class ViewerRecorder:
+    """ Forwards to a recorder and pushes every sample row to a LiveViewer """
+
+    def __init__(self,view,inner):
+        self.view = view
+        self.inner = inner
+
+    def start(self,N,dtype = np.float64):
+        self.inner.start(N,dtype)
+
+    def record(self,i,row):
+        self.inner.record(i,row)
+        self.view.push(row)
+
+    def result(self):
+        self.view.draw()
+        return self.inner.result()
+
+
+if __name__ == "__main__":
+    import models
+    from rollout import wrap
+
+    # several ships on different heading changes, simulated as fast as possible
+    R, h, T = 6, 0.1, 3000
+    target = np.radians(np.linspace(-150,150,R))
+    f = models.get('mariner').function
+    view = LiveViewer(ships = R)
+    x = np.zeros((7,R))
+    t0 = timer.perf_counter()
+    for i in range(round(T/h)):
+        u = np.clip(3*wrap(target-x[5])-60*x[2],-0.61,0.61)
+        xdot,U = f(x,u)
+        x = x+h*np.array(xdot)
+        view.push(np.column_stack((np.full(R,i*h),x[:6].T,U,u)))
+    wall = timer.perf_counter()-t0
+    print("%d ships, %d s simulated in %.1f s (%.0fx real time), %d frames, %.1f ms per frame" %
+          (R,T,wall,T/wall,view.frames,view.frame_time/view.frames*1e3))
+    plt.ioff()
+    plt.show()
@@ -0,0 +1,158 @@
+"""
+Vectorized zig-zag metrics over batches of trajectories
+
+extract() takes a batch of heading and rudder series as 2-D arrays (one run per
+row), finds the rudder switches and the heading extrema with array operations
+and returns the standard zig-zag metrics of every run at once:
+
+    overshoot_1, overshoot_2 : first and second overshoot angles (deg)
+    turning_time             : initial turning time, rudder execute to first switch (sec)
+    check_time               : time to check yaw, first switch to first heading extremum (sec)
+    period                   : time of a full rudder cycle, first to third switch (sec)
+
+Metrics of runs that do not reach the corresponding event are NaN.
+
+"""
+
+import time as timer
+import numpy as np
+import models
+
+
+def _nth(mask,n):
+    """ Column of the n-th True of every row of mask (-1 if there are fewer) """
+    count = np.cumsum(mask,axis=1,dtype=np.int32)
+    k = np.argmax(count >= n,axis=1)
+    return np.where(count[:,-1] >= n,k,-1)
+
+
+def _extract(psi,delta,t,heading):
+    R,T = psi.shape
+    rows = np.arange(R)
+    idx = np.arange(T)
+
+    s = np.sign(delta)
+    execute = _nth(s != 0,1)
+
+    # rudder switches: sign of the commanded rudder flips between two samples
+    switch = np.zeros((R,T),dtype=bool)
+    switch[:,1:] = (s[:,1:] != s[:,:-1]) & (s[:,:-1] != 0) & (s[:,1:] != 0)
+    k1,k2,k3 = _nth(switch,1),_nth(switch,2),_nth(switch,3)
+
+    # heading extrema: sign change of the heading increment
+    dpsi = np.diff(psi,axis=1)
+    extremum = np.zeros((R,T),dtype=bool)
+    extremum[:,1:-1] = dpsi[:,:-1]*dpsi[:,1:] < 0
+    e1 = _nth(extremum & (idx >= k1[:,None]) & (k1[:,None] >= 0),1)
+
+    apsi = np.abs(psi)
+    between = lambda a,b: (idx >= a[:,None]) & (idx < b[:,None]) & (a[:,None] >= 0) & (b[:,None] >= 0)
+    o1 = np.where(between(k1,k2),apsi,-np.inf).max(axis=1)-heading
+    o2 = np.where(between(k2,k3),apsi,-np.inf).max(axis=1)-heading
+
+    tt = t if t.ndim == 2 else np.broadcast_to(t,(R,T))
+    at = lambda k: np.where(k >= 0,tt[rows,np.maximum(k,0)],np.nan)
+    nan = lambda a: np.where(np.isfinite(a),a,np.nan)
+    return {'overshoot_1'  : nan(o1),
+            'overshoot_2'  : nan(o2),
+            'turning_time' : at(k1)-at(execute),
+            'check_time'   : at(e1)-at(k1),
+            'period'       : at(k3)-at(k1)}
+
+
+def extract(psi,delta,t,heading = 20,chunk = 1024):
+    """
+    Zig-zag metrics of a batch of runs
+
+    Parameters
+    ----------
+    psi     : (R, T) yaw angle (deg)
+    delta   : (R, T) commanded rudder angle (deg), delta_c of the drivers
+    t       : (T,) or (R, T) time vector (sec)
+    heading : heading angle of the zig-zag (deg), scalar or (R,)
+    chunk   : runs processed at a time, bounds the temporary arrays
+
+    Returns
+    -------
+    metrics : dict of (R,) arrays, see the module docstring
+
+    """
+    psi = np.atleast_2d(psi)
+    delta = np.atleast_2d(delta)
+    t = np.asarray(t)
+    heading = np.broadcast_to(np.asarray(heading,dtype=float),(len(psi),))
+    parts = []
+    for i in range(0,len(psi),chunk):
+        tc = t[i:i+chunk] if t.ndim == 2 else t
+        parts.append(_extract(psi[i:i+chunk],delta[i:i+chunk],tc,heading[i:i+chunk]))
+    return {k: np.concatenate([p[k] for p in parts]) for k in parts[0]}
+
+
+def simulate(rudder,heading,Req_simulation_time,t_rudderexecute,h,U0 = 7.7175,dtype = np.float32,
+             ship = 'mariner',coeffs = None,states = False,disturbance = None):
+    """
+    Batched zig-zag maneuvers, one ship per element of rudder/heading
+    (heading = np.inf never switches the rudder, i.e. a turning circle)
+
+    Parameters
+    ----------
+    U0     : nominal speed, scalar or (R,)
+    coeffs : coefficient table of the model, entries may be (R,) arrays (e.g. loading cases)
+    states : also return the full state history
+    disturbance : disturbances.Disturbance of R runs (Monte Carlo of the sea state), optional
+
+    Returns
+    -------
+    t          : (T,) time vector
+    psi, delta : (R, T) yaw angle and commanded rudder angle (deg)
+    X          : (R, T, 7) states, only if states = True
+
+    """
+    rudder = np.asarray(rudder,dtype=float)*np.pi/180
+    heading = np.asarray(heading,dtype=float)*np.pi/180
+    N = round(Req_simulation_time/h)
+    R = len(rudder)
+    x = np.zeros((7,R))
+    u_ship = np.zeros(R)
+    psi = np.empty((R,N),dtype=dtype)
+    delta = np.empty((R,N),dtype=dtype)
+    if states:
+        X = np.empty((R,N,7),dtype=dtype)
+    f = models.get(ship).function
+    for i in range(N):
+        time = i*h
+        if time >= t_rudderexecute:
+            u_ship = np.where(time-h < t_rudderexecute,rudder,u_ship)
+            u_ship = np.where((x[5] >= heading) & (x[2] > 0),-rudder,u_ship)
+            u_ship = np.where((x[5] <= -heading) & (x[2] < 0),rudder,u_ship)
+        xdot,U = f(x,u_ship,U0,coeffs)
+        if disturbance is not None:
+            xdot = disturbance.apply(i,x,xdot)
+        x = x+h*np.array(xdot)
+        psi[:,i] = x[5]*180/np.pi
+        delta[:,i] = u_ship*180/np.pi
+        if states:
+            X[:,i] = x.T
+    if states:
+        return np.arange(N)*h,psi,delta,X
+    return np.arange(N)*h,psi,delta
+
+
+if __name__ == "__main__":
+    R = 10000                                 #number of runs
+    rng = np.random.default_rng(0)
+    angle = rng.choice([10,15,20,25],R)       #rudder angle = heading angle (deg)
+
+    t0 = timer.perf_counter()
+    t,psi,delta = simulate(angle,angle,300,10,0.1)
+    print("Simulated %d zig-zags in %.1f s" % (R,timer.perf_counter()-t0))
+
+    t0 = timer.perf_counter()
+    metrics = extract(psi,delta,t,angle)
+    print("Extracted metrics of %d runs (%d samples each) in %.3f s" % (R,len(t),timer.perf_counter()-t0))
+
+    for a in (10,15,20,25):
+        m = angle == a
+        print("%2d/%2d  overshoot 1 : %6.2f  overshoot 2 : %6.2f  turning time : %6.1f  period : %6.1f" %
+              (a,a,np.nanmean(metrics['overshoot_1'][m]),np.nanmean(metrics['overshoot_2'][m]),
+               np.nanmean(metrics['turning_time'][m]),np.nanmean(metrics['period'][m])))
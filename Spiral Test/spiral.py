@@ -149,7 +149,7 @@ def activate(ship,x,ui,Req_simulation_time,t_rudderexecute,h,maneuver="ccw"):
             temp.append(x[j])
         temp.append(U[0])
         temp.append(u_ship)
-        xout[i,:] = temp     
+        xout[i,:] = np.hstack(temp)
         # print(temp)
         ############
         # print(i)